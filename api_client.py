@@ -0,0 +1,385 @@
+# api_client.py (Frontend - Cliente HTTP compartido)
+#
+# Streamlit vuelve a ejecutar app.py en cada interacción, así que cualquier objeto
+# creado allí se pierde en el siguiente rerun. Este módulo solo se importa una vez
+# por proceso, por lo que la sesión HTTP (y su pool de conexiones keep-alive) se
+# comparte entre todos los reruns y todas las sesiones de usuario.
+#
+# Todas las peticiones llevan timeout de conexión y de lectura. Los GET (que son
+# idempotentes) se reintentan unas pocas veces con espera aleatoria, y un
+# circuit breaker corta las peticiones durante un rato cuando la API falla
+# seguido: en ese modo degradado se lanza CircuitOpenError al instante (es un
+# ConnectionError, así que los helpers usan sus valores por defecto) en lugar de
+# dejar hilos bloqueados esperando a Render.
+#
+# request_scope() agrupa las peticiones de un rerun: dentro de él, los GET
+# idénticos (método, ruta, parámetros y token) van a la red una sola vez, y si
+# dos hilos piden lo mismo a la vez comparten la misma llamada en curso.
+#
+# Los GET con ``conditional=True`` (catálogo e historial) guardan el cuerpo junto
+# con su ETag / Last-Modified y la siguiente vez envían If-None-Match /
+# If-Modified-Since: si el servidor contesta 304 se devuelve la copia local como
+# si fuera un 200, y solo se han intercambiado cabeceras. Las respuestas llegan
+# comprimidas (Accept-Encoding: gzip) y requests las descomprime solo. Esas copias
+# van en una BoundedCache (ver caches.py) de NUTRIGOAL_VALIDATED_MAX entradas,
+# con el token del usuario como dueño.
+
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from caches import BoundedCache
+from metrics import endpoint_name, record_request
+from tracing import end_span, start_span
+
+# La URL de tu API en la nube (la que te dio Render). ¡DEBES CAMBIAR ESTO!
+# NUTRIGOAL_API_URL permite apuntar a otra, por ejemplo a stub_api.py en local.
+API_URL = os.environ.get("NUTRIGOAL_API_URL", "https://nutrigoal-api.onrender.com").rstrip("/")
+
+# Tamaño del pool de conexiones (configurable por variables de entorno)
+POOL_CONNECTIONS = int(os.environ.get("NUTRIGOAL_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.environ.get("NUTRIGOAL_POOL_MAXSIZE", "16"))
+POOL_BLOCK = os.environ.get("NUTRIGOAL_POOL_BLOCK", "0") == "1"
+
+# Timeouts en segundos: (conexión, lectura)
+CONNECT_TIMEOUT = float(os.environ.get("NUTRIGOAL_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("NUTRIGOAL_READ_TIMEOUT", "20"))
+
+# Reintentos de GET y espera base (se duplica en cada intento, con jitter)
+GET_RETRIES = int(os.environ.get("NUTRIGOAL_GET_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("NUTRIGOAL_RETRY_BACKOFF", "0.3"))
+RETRY_STATUSES = {502, 503, 504}
+
+# Circuit breaker: fallos seguidos para abrirlo y segundos que permanece abierto
+BREAKER_THRESHOLD = int(os.environ.get("NUTRIGOAL_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("NUTRIGOAL_BREAKER_COOLDOWN", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Copias de respuestas condicionales que se conservan (catálogos, páginas de historial...)
+VALIDATED_MAX = int(os.environ.get("NUTRIGOAL_VALIDATED_MAX", "2000"))
+
+# Cabecera con la clave que identifica una escritura y permite reintentarla sin duplicarla
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+_current_scope = contextvars.ContextVar("nutrigoal_request_scope", default=None)
+
+# (path, params, token) -> {"etag", "last_modified", "content", "headers", "encoding"}
+_validated = BoundedCache("validated", max_entries=VALIDATED_MAX)
+
+
+class RequestScope:
+    """Memo of the GET requests sent during one script run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # clave -> Future con la respuesta (o la excepción)
+        self.hits = 0
+        self.misses = 0
+
+    def fetch(self, key, send):
+        """Returns the response for key, calling send() only for the first caller."""
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._calls[key] = Future()
+            else:
+                self.hits += 1
+        if not owner:
+            return future.result()
+        try:
+            response = send()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(response)
+        return response
+
+    def clear(self):
+        """Forgets every memoized response (after a write, for instance)."""
+        with self._lock:
+            self._calls.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+@contextlib.contextmanager
+def request_scope(on_close=None):
+    """Deduplicates identical GETs sent inside the block.
+
+    The scope lives in a context variable, so it covers the calling thread and
+    any work submitted with ``contextvars.copy_context().run``. ``on_close`` is
+    called with the hit/miss counts when the block ends.
+    """
+    scope = RequestScope()
+    reset_token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(reset_token)
+        if on_close is not None:
+            on_close(scope.stats())
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Counts consecutive failed API requests (retries included in one) and fails fast after too many.
+
+    closed -> open after ``threshold`` failures in a row; open -> half-open once
+    ``cooldown`` seconds have passed, letting a single trial request through;
+    the trial closes the breaker on success or reopens it on failure.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                raise CircuitOpenError("La API no responde; usando valores por defecto.")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("API circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                logger.warning("API circuit breaker open after %d failures", self._failures)
+
+    def state(self):
+        """Returns {"state": "closed" | "open" | "half-open", "failures": int, "retry_in": float}."""
+        with self._lock:
+            if self._opened_at is None:
+                return {"state": "closed", "failures": self._failures, "retry_in": 0.0}
+            retry_in = max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+            state = "open" if retry_in > 0 and not self._trial_running else "half-open"
+            return {"state": state, "failures": self._failures, "retry_in": retry_in}
+
+
+breaker = CircuitBreaker()
+
+
+def breaker_state():
+    """Returns the circuit breaker state; anything but "closed" means degraded mode."""
+    return breaker.state()
+
+
+def _build_session():
+    """Creates a session with keep-alive pooling and the default headers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=POOL_BLOCK,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    """Returns the process-wide HTTP session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _response_size(response):
+    """Bytes on the wire (Content-Length) or, without that header, of the decoded body."""
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return len(response.content)
+
+
+def _send(method, url, **kwargs):
+    """Sends one attempt.
+
+    Every attempt that reaches the network is timed in metrics.py and, inside
+    a traced run, recorded as a span whose id travels in ``traceparent``.
+    """
+    headers = kwargs["headers"] = dict(kwargs.get("headers") or {})
+    trace, span_id = start_span(headers)
+    wall_start = time.time()
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        elapsed = time.perf_counter() - started
+        record_request(method, url, elapsed)
+        end_span(trace, span_id, endpoint_name(method, url), wall_start, elapsed)
+        raise
+    elapsed = time.perf_counter() - started
+    record_request(method, url, elapsed, response.status_code)
+    end_span(trace, span_id, endpoint_name(method, url), wall_start, elapsed, response.status_code,
+             _response_size(response))
+    return response
+
+
+def _response_from_copy(copy, url):
+    """Builds a 200 response from a stored copy, for a 304 answer."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = copy["content"]
+    response.headers.update(copy["headers"])
+    response.encoding = copy["encoding"]
+    response.url = url
+    response.revalidated = True
+    return response
+
+
+def _send_conditional(url, headers, kwargs, cache_key):
+    """Sends a GET with the stored validators and serves a 304 from the local copy."""
+    copy = _validated.get(cache_key)
+    headers = dict(headers)
+    if copy is not None:
+        if copy["etag"]:
+            headers["If-None-Match"] = copy["etag"]
+        if copy["last_modified"]:
+            headers["If-Modified-Since"] = copy["last_modified"]
+
+    response = _send_with_retries("GET", url, headers, kwargs)
+    if response.status_code == 304 and copy is not None:
+        return _response_from_copy(copy, url)
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.status_code == 200 and (etag or last_modified):
+        _validated.set(cache_key, {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content": response.content,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+            "encoding": response.encoding,
+        }, owner=cache_key[2])
+    return response
+
+
+def api_request(method, path, token=None, conditional=False, **kwargs):
+    """Sends a request to the API through the shared session.
+
+    The user's token is added as the ``x-access-tokens`` header, so the helpers
+    in app.py only pass the path and the payload. GETs are retried on
+    connection errors, timeouts and 502/503/504 answers; other methods are sent
+    once. Raises ``CircuitOpenError`` while the breaker is open.
+
+    With ``conditional=True`` a GET is revalidated with ETag / Last-Modified
+    and a 304 answer is returned as a 200 built from the stored body.
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    if token:
+        headers["x-access-tokens"] = token
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    url = f"{API_URL}{path}"
+
+    params = kwargs.get("params") or {}
+    key = (method, path, tuple(sorted(params.items())), token)
+    if method == "GET" and conditional:
+        send = lambda: _send_conditional(url, headers, kwargs, key[1:])  # noqa: E731
+    else:
+        send = lambda: _send_with_retries(method, url, headers, kwargs)  # noqa: E731
+
+    scope = _current_scope.get()
+    if scope is None:
+        return send()
+    if method != "GET":
+        # Una escritura puede cambiar cualquier respuesta ya memorizada
+        scope.clear()
+        return send()
+    return scope.fetch(key, send)
+
+
+def _send_with_retries(method, url, headers, kwargs):
+    """Sends one logical request through the breaker; GETs are retried.
+
+    The breaker sees one outcome per call, after the last attempt: a GET that
+    only succeeds on a retry is one success, and one whose attempts all fail
+    (connection error or 5xx) is one failure, not one per attempt.
+    """
+    breaker.before_request()
+    try:
+        response = _retry(method, url, headers, kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def _retry(method, url, headers, kwargs):
+    retries = GET_RETRIES if method == "GET" else 0
+
+    for attempt in range(retries + 1):
+        last_attempt = attempt == retries
+        try:
+            response = _send(method, url, headers=headers, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if last_attempt:
+                raise
+        else:
+            if last_attempt or response.status_code not in RETRY_STATUSES:
+                return response
+        # Full jitter para no reintentar todos a la vez contra un servidor que arranca
+        time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+def api_get(path, token=None, conditional=False, **kwargs):
+    return api_request("GET", path, token=token, conditional=conditional, **kwargs)
+
+
+def api_post(path, token=None, **kwargs):
+    return api_request("POST", path, token=token, **kwargs)
+
+
+def api_put(path, token=None, **kwargs):
+    return api_request("PUT", path, token=token, **kwargs)
+
+
+def api_delete(path, token=None, **kwargs):
+    return api_request("DELETE", path, token=token, **kwargs)
@@ -3,11 +3,27 @@
 import streamlit as st
 import requests
 from datetime import datetime, timedelta
+import contextlib
+import functools
+import hmac
+import os
 import random
+import time
 from translations import APP_STRINGS  # Asume que este archivo existe y está en el repositorio.
-
-# La URL de tu API en la nube (la que te dio Render). ¡DEBES CAMBIAR ESTO!
-API_URL = "https://nutrigoal-api.onrender.com"
+from api_client import IDEMPOTENCY_HEADER, api_post, api_put, api_delete, breaker_state, request_scope
+from dashboard import (REFRESH_POLL_INTERVAL, last_known_dashboard_data, load_dashboard_data, load_dashboard_list,
+                       load_history_page, post_food_logs, reconcile, apply_added_log, apply_added_logs,
+                       apply_deleted_log, apply_goal, apply_queued_ops)
+from catalog import get_catalog_by_id
+from food_search import search_foods
+from write_queue import (FLUSH_INTERVAL, bind_token, enqueue_add, enqueue_delete, forget_sent_log, forget_token,
+                         new_op_key, pending_ops, sent_adds, start_flusher)
+from metrics import prometheus_text, record_rerun, snapshot as metrics_snapshot, start_dumper
+from tracing import current_trace, trace
+from caches import CacheLease, release_owner
+
+# Wall time of this run, recorded in metrics.py when the run ends
+RUN_STARTED = time.perf_counter()
 
 # Set wide layout for the app once at the beginning
 st.set_page_config(layout="wide", page_title="NutriGoal")
@@ -23,181 +39,224 @@ div[data-baseweb="tab-list"] {
 """, unsafe_allow_html=True)
 
 
+# --- Tracing ---
+
+def finish_run(label, started, stats):
+    """Keeps the request memo hit/miss counts of the last run and records its wall time."""
+    st.session_state.request_stats = stats
+    st.session_state.last_trace_id = st.session_state.get('trace_id')
+    record_rerun(label, time.perf_counter() - started)
+
+
+@contextlib.contextmanager
+def run_scope(name, started=None):
+    """Opens the trace and request scope of one run: the whole script, a fragment or a callback.
+
+    The trace id goes to the API in the traceparent header and is kept in
+    st.session_state.trace_id (shown on the diagnostics page). Identical GETs
+    inside go to the network once; the hit/miss counts of the last run are kept
+    in st.session_state.request_stats. The wall time is recorded under the page,
+    followed by ``name`` for anything but a full run.
+    """
+    page = st.session_state.get('page')
+    label = page if name == "rerun" else f"{page} · {name}"
+    started = time.perf_counter() if started is None else started
+    with trace(name, page=page, user=st.session_state.get('username')) as run_trace, \
+            request_scope(on_close=lambda stats: finish_run(label, started, stats)):
+        st.session_state.trace_id = run_trace.trace_id
+        yield run_trace
+
+
+def traced(name):
+    """Decorator for widget callbacks and fragment bodies: runs them inside run_scope(name).
+
+    Callbacks and fragment reruns execute outside the main block of the script,
+    so without it their requests would carry no traceparent and not be timed.
+    Inside a full run the function simply joins the run's trace.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current_trace() is not None:
+                return fn(*args, **kwargs)
+            with run_scope(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
 # --- Helper Functions ---
 
-def get_foods_from_api():
-    """Fetches the list of foods from the API based on the selected language."""
-    try:
-        lang = st.session_state.get('lang', 'es')
-        response = requests.get(f"{API_URL}/api/foods?lang={lang}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            # Manejar errores que no son de conexión pero el servidor está activo
-            st.error("Error al obtener la lista de alimentos. Código de estado: " + str(response.status_code))
-            return []
-    except requests.exceptions.ConnectionError:
-        st.error("Error al conectar con la API. Asegúrate de que el servidor está funcionando.")
-        return []
-
-
-def get_user_goal_from_api(token):
-    """Fetches the user's weekly vegetable goal from the API."""
-    headers = {
-        "x-access-tokens": token
-    }
+def get_food_names_by_id():
+    """Maps food ids to their names in the selected language (empty if the catalog is unavailable)."""
     try:
-        response = requests.get(f"{API_URL}/api/user/goal", headers=headers)
-        if response.status_code == 200:
-            return response.json().get('weekly_vegetable_goal', 30)
-        else:
-            return 30
-    except requests.exceptions.ConnectionError:
-        st.error(
-            "Error al conectar con la API para obtener el objetivo. Asegúrate de que el servidor está funcionando.")
-        return 30
+        return {food_id: food['name'] for food_id, food in get_catalog_by_id(st.session_state.lang).items()}
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
 
 
-def add_food_log(food_id, token):
-    headers = {
-        "x-access-tokens": token
-    }
-    data = {
-        "food_id": food_id
-    }
-    try:
-        response = requests.post(f"{API_URL}/api/user_food_logs", headers=headers, json=data)
-        if response.status_code == 201:
-            st.success("¡Alimento añadido con éxito!")
-            st.rerun()  # Force a refresh to update the history table
-        else:
-            if response.content:
-                error_message = response.json().get('error', 'Error desconocido')
-                st.error("Error al añadir el alimento. Mensaje del servidor: " + error_message)
-            else:
-                st.error("Error al añadir el alimento. El servidor no devolvió una respuesta válida.")
+def sync_queued_ops():
+    """Shows the user's queued writes (and sent adds not reconciled yet) in the session data."""
+    if 'user_data' in st.session_state:
+        username = st.session_state.username
+        apply_queued_ops(st.session_state.user_data, st.session_state.token, pending_ops(username),
+                         sent_adds(username))
+
 
-    except requests.exceptions.ConnectionError:
-        st.error("Error al conectar con la API. Asegúrate de que el servidor está funcionando.")
+def queue_food_log(food_id, token, op_key):
+    """Keeps a log the API could not take in the local write queue."""
+    food_name = get_food_names_by_id().get(food_id, "")
+    enqueue_add(st.session_state.username, token, food_id, food_name, op_key)
+    sync_queued_ops()
+    st.session_state.add_food_message = (
+        "warning", "Sin conexión con la API: el alimento se guardará en cuanto vuelva a estar disponible.")
 
 
-def get_food_logs_from_api(token):
-    """Fetches the user's food log history from the API."""
-    headers = {
-        "x-access-tokens": token
+def add_food_log(food_id, token):
+    """Logs a food and applies it to the session data; returns True on success.
+
+    Runs inside widget callbacks, where elements can't be displayed during a
+    fragment rerun, so the outcome is stored in st.session_state.add_food_message
+    and shown by the add-food fragment. If the API can't be reached the log is
+    queued (see write_queue.py) with the same idempotency key, so a request that
+    did reach the server is never stored twice.
+    """
+    data = {
+        "food_id": food_id
     }
+    op_key = new_op_key()
     try:
-        response = requests.get(f"{API_URL}/api/user_food_logs", headers=headers)
-        if response.status_code == 200:
-            return response.json()
+        response = api_post("/api/user_food_logs", token, json=data, headers={IDEMPOTENCY_HEADER: op_key})
+        if response.status_code >= 500:
+            queue_food_log(food_id, token, op_key)
+        elif response.status_code == 201:
+            st.session_state.add_food_message = ("success", "¡Alimento añadido con éxito!")
+            # Write-through: the rerun reads the updated session data without refetching
+            if 'user_data' in st.session_state:
+                apply_added_log(st.session_state.user_data, token, food_id,
+                                response.json() if response.content else None)
+            return True
         else:
             if response.content:
                 error_message = response.json().get('error', 'Error desconocido')
-                st.error("Error al obtener el historial. Mensaje del servidor: " + error_message)
+                st.session_state.add_food_message = (
+                    "error", "Error al añadir el alimento. Mensaje del servidor: " + error_message)
             else:
-                st.error("Error al obtener el historial. El servidor no devolvió una respuesta válida.")
-            return []
-    except requests.exceptions.ConnectionError:
-        st.error("Error al conectar con la API. Asegúrate de que el servidor está funcionando.")
-        return []
+                st.session_state.add_food_message = (
+                    "error", "Error al añadir el alimento. El servidor no devolvió una respuesta válida.")
 
+    except requests.exceptions.RequestException:
+        queue_food_log(food_id, token, op_key)
+    return False
 
-def get_suggested_foods_from_api(token):
-    """Fetches a list of suggested foods for the user from the API."""
-    headers = {
-        "x-access-tokens": token
-    }
-    try:
-        response = requests.get(f"{API_URL}/api/suggested_foods", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error("Error al obtener las sugerencias. Mensaje del servidor: " + response.json().get('error', ''))
-            return []
-    except requests.exceptions.ConnectionError:
-        st.error("Error al conectar con la API para obtener sugerencias.")
-        return []
 
+def add_food_logs(food_ids, token):
+    """Logs several foods (a whole meal) in one batch request; returns how many were added.
 
-def get_user_progress_from_api(token):
-    """Calculates the number of unique vegetables consumed this week."""
-    headers = {
-        "x-access-tokens": token
-    }
+    Like add_food_log, the outcome goes to st.session_state.add_food_message.
+    Items the API could not take are queued with their idempotency keys, and
+    the session data is updated once for the whole meal.
+    """
+    items = [(food_id, new_op_key()) for food_id in food_ids]
     try:
-        response = requests.get(f"{API_URL}/api/user_progress", headers=headers)
-        if response.status_code == 200:
-            return response.json().get('vegetable_count', 0)
+        results = post_food_logs(token, items)
+    except requests.exceptions.RequestException:
+        results = [(None, {})] * len(items)
+
+    food_names = get_food_names_by_id()
+    added, queued, failed = [], [], []
+    for (food_id, op_key), (status, body) in zip(items, results):
+        if status in (200, 201):
+            added.append((food_id, body))
+        elif status is None or status >= 500:
+            enqueue_add(st.session_state.username, token, food_id, food_names.get(food_id, ""), op_key)
+            queued.append(food_id)
         else:
-            st.error(
-                "Error al obtener el progreso del usuario. Mensaje del servidor: " + response.json().get('error', ''))
-            return 0
-    except requests.exceptions.ConnectionError:
-        st.error("Error al conectar con la API para obtener el progreso.")
-        return []
-
-
-def get_diversity_metrics_from_api(token):
-    headers = {"x-access-tokens": token}
-    try:
-        response = requests.get(f"{API_URL}/api/diversity_metrics", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        return {"prebiotic_count": 0, "probiotic_count": 0}
-    except requests.exceptions.ConnectionError:
-        return {"prebiotic_count": 0, "probiotic_count": 0}
-
-
-def get_user_vegetables_from_api(token):
-    """Fetches the list of unique vegetables consumed by the user this week."""
-    headers = {
-        "x-access-tokens": token
-    }
-    try:
-        response = requests.get(f"{API_URL}/api/user_vegetables", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return []
-    except requests.exceptions.ConnectionError:
-        return []
-
-
-def get_user_prebiotics_from_api(token):
-    """Fetches the list of unique prebiotics consumed by the user this week."""
-    headers = {"x-access-tokens": token}
-    try:
-        response = requests.get(f"{API_URL}/api/user_prebiotics", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        return []
-    except requests.exceptions.ConnectionError:
-        return {"prebiotic_count": 0}
-
-
-def get_user_probiotics_from_api(token):
-    """Fetches the list of unique probiotics consumed by the user this week."""
-    headers = {"x-access-tokens": token}
-    try:
-        response = requests.get(f"{API_URL}/api/user_probiotics", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        return []
-    except requests.exceptions.ConnectionError:
-        return {"probiotic_count": 0}
-
-
-def delete_food_log_from_api(log_id, token):
-    headers = {"x-access-tokens": token}
-    try:
-        response = requests.delete(f"{API_URL}/api/user_food_logs/{log_id}", headers=headers)
+            failed.append(f"{food_names.get(food_id, food_id)} ({body.get('error', status)})")
+
+    if 'user_data' in st.session_state:
+        apply_added_logs(st.session_state.user_data, token, added)
+    if queued:
+        sync_queued_ops()
+
+    if failed:
+        st.session_state.add_food_message = (
+            "error", f"Añadidos: {len(added)}. No se pudieron añadir: " + ", ".join(failed))
+    elif queued:
+        st.session_state.add_food_message = (
+            "warning", f"Añadidos: {len(added)}. Sin conexión con la API: {len(queued)} alimento(s) se "
+                       "guardarán en cuanto vuelva a estar disponible.")
+    else:
+        st.session_state.add_food_message = ("success", f"¡Comida registrada! {len(added)} alimentos añadidos.")
+    return len(added)
+
+
+def delete_food_logs_from_api(log_ids, token):
+    """Deletes one or more logs and refreshes the page once at the end.
+
+    Deletions the API can't take (no connection or a 5xx answer) are queued
+    and sent later (see write_queue.py), like add_food_log does with adds.
+    """
+    failed = queued = 0
+    for i, log_id in enumerate(log_ids):
+        op_key = new_op_key()
+        try:
+            response = api_delete(f"/api/user_food_logs/{log_id}", token, headers={IDEMPOTENCY_HEADER: op_key})
+        except requests.exceptions.RequestException:
+            response = None
+        if response is None or response.status_code >= 500:
+            # Sin conexión o error del servidor: encolar este borrado y los que quedaban
+            for queued_id in log_ids[i:]:
+                enqueue_delete(st.session_state.username, token, queued_id)
+            queued = len(log_ids) - i
+            break
         if response.status_code == 200:
-            st.success("¡Alimento eliminado con éxito!")
-            st.rerun()  # Force a refresh to update the history table
+            forget_sent_log(st.session_state.username, log_id)
+            if 'user_data' in st.session_state:
+                apply_deleted_log(st.session_state.user_data, token, log_id)
         else:
-            st.error("Error al eliminar el alimento.")
-    except requests.exceptions.ConnectionError:
-        st.error("Error de conexión al intentar eliminar el alimento.")
+            failed += 1
+    if queued:
+        # The queued deletions are hidden from the session data until they are sent
+        sync_queued_ops()
+    if failed:
+        st.error("Error al eliminar el alimento.")
+        return
+    if queued:
+        st.warning("Sin conexión con la API: los registros se eliminarán en cuanto vuelva a estar disponible.")
+    else:
+        st.success("¡Alimento eliminado con éxito!")
+    st.rerun()  # Force a refresh to update the history table
+
+
+def get_user_data():
+    """Returns the session's dashboard data (logs, goal, weekly metrics), loading it on first use.
+
+    Later reruns are served from st.session_state.user_data, which is kept up to
+    date by the write helpers and reconciled with the server in the background.
+    A new session starts from the user's last known data if this process has
+    any (stale-while-revalidate), so only a user's very first load blocks.
+
+    The reconcile and the write queue overlay happen on the first call of each
+    run (see run_scope); the sections that call it again during the same run
+    get the same dict back.
+    """
+    token, lang = st.session_state.token, st.session_state.lang
+    data = st.session_state.get('user_data')
+    run = current_trace()
+    run_id = run.trace_id if run is not None else None
+    if data is not None and data['lang'] == lang and run_id is not None \
+            and st.session_state.get('user_data_run') == run_id:
+        return data
+    if data is None or data['lang'] != lang:
+        data = last_known_dashboard_data(token, lang)
+        if data is None:
+            data = load_dashboard_data(token, lang)
+    data = reconcile(data, token, lang)
+    st.session_state.user_data = data
+    st.session_state.user_data_run = run_id
+    sync_queued_ops()
+    return data
 
 
 # Datos para la Dosis Exprés de Sabiduría Nutricional
@@ -257,20 +316,127 @@ NUTRI_WISDOMS = [
 
 # --- Page Content Functions ---
 
-def render_home_content():
-    strings = APP_STRINGS[st.session_state.lang]
+# Fragments of the home dashboard whose content depends on the user's logs
+HOME_FRAGMENTS = ["home_progress", "home_add_food", "home_suggestions"]
+
+
+def sync_add_food_expander():
+    """Keeps the ➕ button state in sync when the user opens or closes the panel by hand."""
+    st.session_state.add_food_expander = st.session_state.add_food_panel
+
+
+def toggle_add_food_panel():
+    """➕ button callback: only the add-food fragment reruns."""
+    st.session_state.add_food_expander = not st.session_state.add_food_expander
+    st.rerun("home_add_food")
+
+
+def dashboard_poll_interval(dashboard):
+    """Seconds between automatic reruns of the dashboard fragment, or None when it doesn't poll.
+
+    While a background refresh is running it reruns to pick it up; queued logs
+    are polled less often, until the flusher has sent them.
+    """
+    if dashboard.get('pending') is not None:
+        return REFRESH_POLL_INTERVAL
+    if dashboard['logs'].pending():
+        return FLUSH_INTERVAL
+    return None
+
 
+def rerun_after_write():
+    """Ends a write callback: reruns the dashboard fragments, or the whole page if polling must start or stop.
+
+    The polling interval of the dashboard fragment is only set by a full run.
+    """
+    if dashboard_poll_interval(get_user_data()) != st.session_state.get('dashboard_poll'):
+        st.rerun()
+    st.rerun(HOME_FRAGMENTS)
+
+
+@traced("add_food")
+def log_selected_food():
+    """Add button callback: logs the selected food and reruns only the dashboard fragments."""
+    food_id = st.session_state.get('food_select')
+    if food_id:
+        add_food_log(food_id, st.session_state.token)
+        rerun_after_write()
+
+
+@traced("add_meal")
+def log_selected_meal():
+    """Meal button callback: logs every selected food in one batch and reruns the dashboard once."""
+    food_ids = st.session_state.get('meal_select') or []
+    if food_ids:
+        add_food_logs(food_ids, st.session_state.token)
+        st.session_state.meal_select = []
+        rerun_after_write()
+
+
+@traced("add_suggestion")
+def log_suggested_food(food_id):
+    """Suggestion chip callback: one click logs the suggested food."""
+    add_food_log(food_id, st.session_state.token)
+    rerun_after_write()
+
+
+def render_home_content():
     # Header and greeting
     st.markdown(f"<h1 style='text-align: center; color: #4CAF50;'>NutriGoal</h1>", unsafe_allow_html=True)
     st.markdown(f"<p style='text-align: center;'>Tu guía hacia una microbiota saludable</p>", unsafe_allow_html=True)
     st.markdown("---")
 
+    # The dashboard renders from the last known data and reruns on its own (only
+    # this fragment) while there is something to pick up (dashboard_poll_interval)
+    run_every = st.session_state.dashboard_poll = dashboard_poll_interval(get_user_data())
+    st.fragment(render_dashboard_content, run_every=run_every)()
+
+    # Wisdom Tip
+    st.markdown(f"<h3 style='text-align: center;'>Aquí Tienes Tu Dosis Exprés de Sabiduría Nutricional ⚡</h3>",
+                unsafe_allow_html=True)
+    with st.container(border=True):  # Use border for a card-like effect
+        st.markdown(f"**{random.choice(NUTRI_WISDOMS)}**")
+
+
+@traced("home_dashboard")
+def render_dashboard_content():
+    strings = APP_STRINGS[st.session_state.lang]
+
+    # All the home page data is fetched concurrently and cached for the session
+    dashboard = get_user_data()
+    # A periodic rerun of this fragment can't change its own interval: when the
+    # polling has to start or stop (refresh done, queue sent) the page reruns
+    if dashboard_poll_interval(dashboard) != st.session_state.get('dashboard_poll'):
+        st.rerun()
+    if dashboard.get('pending') is not None:
+        st.caption("🔄 Actualizando…")
+    if dashboard['errors']:
+        st.error(strings['connection_error'])
+
+    # Initialize session state for expander if it doesn't exist
+    if 'add_food_expander' not in st.session_state:
+        st.session_state.add_food_expander = False
+
+    # Each section is a fragment: their widgets only rerun the affected sections
+    render_progress_section()
+    st.markdown("---")
+    render_add_food_section()
+    render_suggestions_section()
+    st.markdown("---")
+
+
+@st.fragment(key="home_progress")
+@traced("home_progress")
+def render_progress_section():
+    strings = APP_STRINGS[st.session_state.lang]
+    dashboard = get_user_data()
+
     # Progress Ring and Diversity Metrics
     col_progress_main, col_diversity_main, col_add_button = st.columns([1, 2, 0.5])
 
     with col_progress_main:
-        user_goal = get_user_goal_from_api(st.session_state.token)
-        vegetable_count = get_user_progress_from_api(st.session_state.token)
+        user_goal = dashboard['goal']
+        vegetable_count = dashboard['vegetable_count']
 
         # Simulate a progress ring with a large metric
         st.markdown(
@@ -279,110 +445,182 @@ def render_home_content():
             unsafe_allow_html=True
         )
         # Progress bar to simulate the ring
-        st.progress(vegetable_count / user_goal)
-
-        with st.expander("Vegetales únicos esta semana"):
-            vegetables_consumed = get_user_vegetables_from_api(st.session_state.token)
-            if vegetables_consumed:
-                for veg in vegetables_consumed:
-                    st.write(f"- {veg}")
-            else:
-                st.write(strings['no_food_added'])
+        st.progress(min(vegetable_count / user_goal, 1.0))
+        # Only known when the metrics are computed locally (see week_rollups.py)
+        last_week = dashboard['last_week_vegetable_count']
+        if last_week is not None:
+            st.caption(f"{vegetable_count - last_week:+d} respecto a la semana pasada ({last_week})")
+
+        # The weekly lists are only loaded once their expander is opened
+        with st.expander("Vegetales únicos esta semana", key="vegetables_expander", on_change="rerun") as expander:
+            if expander.open:
+                vegetables_consumed = load_dashboard_list(dashboard, 'vegetables', st.session_state.token,
+                                                          st.session_state.lang)
+                if vegetables_consumed:
+                    for veg in vegetables_consumed:
+                        st.write(f"- {veg}")
+                else:
+                    st.write(strings['no_food_added'])
 
     with col_diversity_main:
         st.markdown("<h3 style='color: #4CAF50;'>Diversidad Semanal</h3>", unsafe_allow_html=True)
-        diversity_metrics = get_diversity_metrics_from_api(st.session_state.token)
+        diversity_metrics = dashboard['diversity']
         prebiotic_count = diversity_metrics['prebiotic_count']
         probiotic_count = diversity_metrics['probiotic_count']
 
-        with st.expander(f"🌱 Prebióticos: {prebiotic_count}/5"):
-            prebiotics_consumed = get_user_prebiotics_from_api(st.session_state.token)
-            if prebiotics_consumed:
-                for pre in prebiotics_consumed:
-                    st.write(f"- {pre}")
-            else:
-                st.write("No has añadido prebióticos esta semana.")
-
-        with st.expander(f"🦠 Probióticos: {probiotic_count}/3"):
-            probiotics_consumed = get_user_probiotics_from_api(st.session_state.token)
-            if probiotics_consumed:
-                for pro in probiotics_consumed:
-                    st.write(f"- {pro}")
-            else:
-                st.write("No has añadido probióticos esta semana.")
+        with st.expander(f"🌱 Prebióticos: {prebiotic_count}/5", key="prebiotics_expander",
+                         on_change="rerun") as expander:
+            if expander.open:
+                prebiotics_consumed = load_dashboard_list(dashboard, 'prebiotics', st.session_state.token,
+                                                          st.session_state.lang)
+                if prebiotics_consumed:
+                    for pre in prebiotics_consumed:
+                        st.write(f"- {pre}")
+                else:
+                    st.write("No has añadido prebióticos esta semana.")
+
+        with st.expander(f"🦠 Probióticos: {probiotic_count}/3", key="probiotics_expander",
+                         on_change="rerun") as expander:
+            if expander.open:
+                probiotics_consumed = load_dashboard_list(dashboard, 'probiotics', st.session_state.token,
+                                                          st.session_state.lang)
+                if probiotics_consumed:
+                    for pro in probiotics_consumed:
+                        st.write(f"- {pro}")
+                else:
+                    st.write("No has añadido probióticos esta semana.")
 
     # Add food button
     with col_add_button:
-        # Initialize session state for expander if it doesn't exist
-        if 'add_food_expander' not in st.session_state:
-            st.session_state.add_food_expander = False
+        st.button("➕", key="add_food_btn", help="Añadir alimento", on_click=toggle_add_food_panel)
 
-        if st.button("➕", key="add_food_btn", help="Añadir alimento"):
-            # Toggle the expander state
-            st.session_state.add_food_expander = not st.session_state.add_food_expander
-            st.rerun()
 
-    st.markdown("---")
+@st.fragment(key="home_add_food")
+@traced("home_add_food")
+def render_add_food_section():
+    strings = APP_STRINGS[st.session_state.lang]
+
+    # Result of the last add (from the form or a suggestion chip)
+    message = st.session_state.pop('add_food_message', None)
+    if message is not None:
+        kind, text = message
+        if kind == "success":
+            st.success(text)
+        elif kind == "warning":
+            st.warning(text)
+        else:
+            st.error(text)
+
+    # Logs waiting in the local write queue until the API is reachable again
+    queued = [log['food_name'] for _, log in get_user_data()['logs'].pending()]
+    if queued:
+        st.caption("⏳ Pendiente de enviar: " + ", ".join(queued))
 
     # Add food form (now inside an expander)
-    # The expander is controlled by the state of the session variable
-    with st.expander("Añadir Alimento", expanded=st.session_state.add_food_expander):
-        foods = get_foods_from_api()
-        food_names = [f['name'] for f in foods]
-        food_dict = {f['name']: f['id'] for f in foods}
+    # The expander is controlled by the state of the session variable. While it
+    # is open the user searches as they type (only this fragment reruns) and
+    # just the best matches are sent to the browser, not the whole catalog
+    with st.expander("Añadir Alimento", expanded=st.session_state.add_food_expander, key="add_food_panel",
+                     on_change=sync_add_food_expander) as add_food_panel:
+        if add_food_panel.open:
+            meal_mode = st.toggle(strings['meal_mode'], key='meal_mode')
+            query = st.text_input(strings['search_food'], key='food_query', type="search", live=True)
+            try:
+                matches = search_foods(st.session_state.lang, query)
+            except (requests.exceptions.RequestException, ValueError):
+                matches = []
+
+            if meal_mode:
+                # The foods already picked stay among the options while the user searches for more
+                food_names = get_food_names_by_id()
+                selected = st.session_state.get('meal_select') or []
+                options = selected + [f['id'] for f in matches if f['id'] not in selected]
+                st.multiselect(strings['select_foods'], options,
+                               format_func=lambda food_id: food_names.get(food_id, str(food_id)), key='meal_select')
+
+                add_meal_col = st.columns([1, 2, 1])[1]
+                with add_meal_col:
+                    st.button(f"{strings['log_meal_button']} ({len(selected)})", key='add_meal_button',
+                              disabled=not selected, use_container_width=True, on_click=log_selected_meal)
+            elif matches:
+                food_names = {f['id']: f['name'] for f in matches}
+                st.selectbox(strings['select_food'], list(food_names), format_func=food_names.get,
+                             key='food_select')
+
+                add_food_col = st.columns([1, 2, 1])[1]  # Centered button
+                with add_food_col:
+                    st.button(strings['add_button'], key='add_button_float', use_container_width=True,
+                              on_click=log_selected_food)
+            else:
+                st.info(strings['no_food_matches'])
 
-        food_selection = st.selectbox(strings['select_food'], food_names, key='food_select')
-        selected_food_id = food_dict.get(food_selection)
 
-        add_food_col = st.columns([1, 2, 1])[1]  # Centered button
-        with add_food_col:
-            if st.button(strings['add_button'], key='add_button_float', use_container_width=True):
-                if selected_food_id:
-                    add_food_log(selected_food_id, st.session_state.token)
+@st.fragment(key="home_suggestions")
+@traced("home_suggestions")
+def render_suggestions_section():
+    strings = APP_STRINGS[st.session_state.lang]
+    dashboard = get_user_data()
 
     # Suggestions
     st.markdown(f"<h3 style='text-align: center;'>💡 {strings['suggestions_title']}</h3>", unsafe_allow_html=True)
-    suggested_foods = get_suggested_foods_from_api(st.session_state.token)
+    suggested_foods = dashboard['suggestions']
 
     if suggested_foods:
-        # Display up to 3 suggestions
+        # Display up to 3 suggestions; clicking one logs it
         suggested_foods_limited = suggested_foods[:3]
         suggestion_cols = st.columns(len(suggested_foods_limited))
         for i, food in enumerate(suggested_foods_limited):
             with suggestion_cols[i]:
-                st.button(food['name'], key=f"suggested_food_{food['id']}", use_container_width=True)
+                st.button(food['name'], key=f"suggested_food_{food['id']}", use_container_width=True,
+                          on_click=log_suggested_food, args=(food['id'],))
     else:
         st.write(f"<p style='text-align: center;'>{strings['congratulations_all_eaten']}</p>", unsafe_allow_html=True)
 
-    st.markdown("---")
-
-    # Wisdom Tip
-    st.markdown(f"<h3 style='text-align: center;'>Aquí Tienes Tu Dosis Exprés de Sabiduría Nutricional ⚡</h3>",
-                unsafe_allow_html=True)
-    with st.container(border=True):  # Use border for a card-like effect
-        st.markdown(f"**{random.choice(NUTRI_WISDOMS)}**")
-
 
 def render_history_content():
     strings = APP_STRINGS[st.session_state.lang]
     st.title(strings['history_button'])
     st.markdown("---")
 
-    logs = get_food_logs_from_api(st.session_state.token)
+    # Only the first page is loaded; older pages are fetched on demand
+    user_data = get_user_data()
+    history = user_data['history']
+    if history is None:
+        try:
+            history = load_history_page(user_data, st.session_state.token)
+        except (requests.exceptions.RequestException, ValueError):
+            st.error(strings['connection_error_api_logs'])
+            history = {"logs": [], "next_cursor": None}
+    logs = history['logs']
+    # Food ids are stable across languages, so names follow the selected language
+    food_names = get_food_names_by_id()
 
     if logs:
         st.write(strings['last_foods_added'])
-        # Simplified table for history
-        for log in logs:
-            col_food, col_date, col_action = st.columns([2, 1.5, 1])
-            with col_food:
-                st.write(log['food_name'])
-            with col_date:
-                st.write(log['date_consumed'])
-            with col_action:
-                if st.button("🗑️", key=f"delete_{log['log_id']}", help=strings['delete_button']):
-                    delete_food_log_from_api(log['log_id'], st.session_state.token)
-            st.markdown("---")  # Separator for each log item
+        # A single table widget with row selection, whatever the number of logs
+        # Queued logs (not sent yet) are marked with ⏳
+        rows = [{"Alimento": food_names.get(log.get('food_id'), log['food_name'])
+                 + (" ⏳" if log.get('pending') else ""),
+                 "Fecha": log['date_consumed']} for log in logs]
+        # The data version is part of the key: after any write the row positions change,
+        # so the old selection must not carry over to different logs
+        table = st.dataframe(rows, key=f"history_table_{user_data['version']}", on_select="rerun",
+                             selection_mode="multi-row", hide_index=True)
+
+        # Un registro recién añadido puede no tener aún su log_id
+        selected_ids = [logs.log_id(i) for i in table.selection.rows
+                        if i < len(logs) and logs.log_id(i) is not None]
+        if st.button(f"🗑️ {strings['delete_button']} ({len(selected_ids)})", key="delete_selected_logs",
+                     disabled=not selected_ids, use_container_width=True):
+            delete_food_logs_from_api(selected_ids, st.session_state.token)
+
+        if history['next_cursor'] is not None:
+            if st.button("Cargar más", key="history_load_more", use_container_width=True):
+                try:
+                    load_history_page(user_data, st.session_state.token)
+                    st.rerun()
+                except (requests.exceptions.RequestException, ValueError):
+                    st.error(strings['connection_error_api_logs'])
     else:
         st.write(strings['no_food_added'])
 
@@ -404,23 +642,34 @@ def render_profile_content():
 
     st.markdown("---")
     st.header(strings['update_goal_title'])
-    user_goal = get_user_goal_from_api(st.session_state.token)
+    user_data = get_user_data()
+    user_goal = user_data['goal']
     with st.form("goal_form"):
         new_goal = st.number_input(strings['new_goal_input'], min_value=1, value=user_goal, key="new_goal")
         submitted = st.form_submit_button(strings['save_goal_button'])
         if submitted:
-            headers = {"x-access-tokens": st.session_state.token}
-            response = requests.put(f"{API_URL}/api/user/goal", headers=headers, json={"goal": new_goal})
-            if response.status_code == 200:
+            try:
+                response = api_put("/api/user/goal", st.session_state.token, json={"goal": new_goal})
+            except requests.exceptions.RequestException:
+                response = None
+            if response is not None and response.status_code == 200:
                 st.success(strings['goal_success'])
+                apply_goal(user_data, st.session_state.token, new_goal)
                 st.rerun()
             else:
                 st.error(strings['goal_error'])
 
     st.markdown("---")
     if st.button(strings['logout_button'], type="secondary"):
+        # Everything this process cached for the user goes now, not when the entries expire
+        lease = st.session_state.pop('cache_lease', None)
+        if lease is not None:
+            lease.close()
+        release_owner(st.session_state.token)
+        forget_token(st.session_state.username, st.session_state.token)
         st.session_state.logged_in = False
         st.session_state.token = None
+        st.session_state.pop('user_data', None)
         st.session_state.page = "login"
         st.rerun()
 
@@ -514,7 +763,7 @@ def render_login_page():
             }
             try:
                 # Conexión a la API de Render
-                response = requests.post(f"{API_URL}/api/login", json=login_data)
+                response = api_post("/api/login", json=login_data)
                 if response.status_code == 200:
                     st.success("¡Inicio de sesión exitoso!")
                     st.session_state.logged_in = True
@@ -525,7 +774,7 @@ def render_login_page():
                     st.rerun()
                 else:
                     st.error(strings['invalid_credentials'])
-            except requests.exceptions.ConnectionError:
+            except requests.exceptions.RequestException:
                 st.error(strings['connection_error'])
 
         if register_button:
@@ -536,7 +785,7 @@ def render_login_page():
             }
             try:
                 # Conexión a la API de Render
-                response = requests.post(f"{API_URL}/api/register", json=registration_data)
+                response = api_post("/api/register", json=registration_data)
                 if response.status_code == 201:
                     st.success(strings['registration_success'])
                 else:
@@ -547,7 +796,7 @@ def render_login_page():
                     else:
                         st.error(f"{strings['registration_error']} El servidor no devolvió una respuesta válida.")
 
-            except requests.exceptions.ConnectionError:
+            except requests.exceptions.RequestException:
                 st.error(strings['connection_error'])
 
 
@@ -574,6 +823,48 @@ def render_welcome_page():
             st.rerun()
 
 
+def sync_page_from_tabs(label_to_page):
+    """Keeps st.session_state.page in sync with the selected tab."""
+    st.session_state.page = label_to_page.get(st.session_state.nav_tabs, "home")
+
+
+def diagnostics_requested():
+    """True for ?diagnostics=<key> with key == NUTRIGOAL_DIAGNOSTICS_KEY; always False if that is unset."""
+    key = os.environ.get("NUTRIGOAL_DIAGNOSTICS_KEY")
+    given = st.query_params.get("diagnostics")
+    return bool(key) and given is not None and hmac.compare_digest(given.encode(), key.encode())
+
+
+def render_diagnostics_page():
+    """Hidden page with the API latency metrics and cache sizes of this process."""
+    st.title("Diagnóstico")
+    metrics = metrics_snapshot()
+    breaker = breaker_state()
+    st.write(f"**Proceso:** {metrics['pid']} · **Circuit breaker:** {breaker['state']} "
+             f"({breaker['failures']} fallos seguidos)")
+    if 'last_trace_id' in st.session_state:
+        st.write(f"**Traza del rerun anterior:** `{st.session_state.last_trace_id}`")
+    if 'request_stats' in st.session_state:
+        stats = st.session_state.request_stats
+        st.write(f"**Peticiones repetidas evitadas en el último rerun:** {stats['hits']} "
+                 f"(enviadas: {stats['misses']})")
+
+    columns = ["count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms"]
+    st.subheader("Endpoints")
+    st.dataframe([{"endpoint": name, **{c: summary[c] for c in columns}}
+                  for name, summary in metrics['endpoints'].items()], hide_index=True)
+    st.subheader("Reruns, fragmentos y callbacks")
+    st.dataframe([{"página": name, **{c: summary[c] for c in columns}}
+                  for name, summary in metrics['reruns'].items()], hide_index=True)
+    caches = metrics['caches']
+    st.subheader("Cachés")
+    st.write(f"**Memoria estimada:** {caches['total_bytes'] / 2 ** 20:.1f} MB de "
+             f"{caches['budget_bytes'] / 2 ** 20:.0f} MB")
+    st.dataframe([{"caché": name, **stats} for name, stats in caches['caches'].items()], hide_index=True)
+    with st.expander("Prometheus"):
+        st.code(prometheus_text(), language="text")
+
+
 # --- Main Application Logic ---
 
 # Inicialización de la sesión
@@ -590,41 +881,61 @@ if 'lang' not in st.session_state:
 if 'page' not in st.session_state:
     st.session_state.page = "welcome"  # Initial page
 
-if st.session_state.logged_in:
-    strings = APP_STRINGS[st.session_state.lang]
+# Send whatever a previous run (or another process) left in the write queue
+start_flusher()
+# Periodic dump of the latency metrics to the data directory
+start_dumper()
 
-    # Use st.tabs for navigation
-    tab_home, tab_history, tab_achievements, tab_profile, tab_guide = st.tabs([
-        f"🌿 {strings['home_button']}",
-        f"📝 {strings['history_button']}",
-        f"⭐ {strings['achievements_button']}",
-        f"🧑‍🌾 {strings['profile_button']}",
-        f"🧭 Guía"
-    ])
-
-    with tab_home:
-        # Centrar el contenido de la página de inicio dentro de la pestaña
-        col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
-        with col_main_center:
-            render_home_content()
-    with tab_history:
-        col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
-        with col_main_center:
-            render_history_content()
-    with tab_achievements:
-        col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
-        with col_main_center:
-            render_achievements_content()
-    with tab_profile:
-        col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
-        with col_main_center:
-            render_profile_content()
-    with tab_guide:
-        col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
-        with col_main_center:
-            render_guide_content()
-else:
-    if st.session_state.page == "welcome":
-        render_welcome_page()
+# A logged-in session holds a lease on its user's cache entries: when Streamlit
+# discards the session the entries are released (unless another session of the
+# same user still holds one)
+if st.session_state.logged_in:
+    lease = st.session_state.get('cache_lease')
+    if lease is None or lease.owner != st.session_state.token:
+        st.session_state.cache_lease = CacheLease(st.session_state.token)
+    # The write queue sends the user's pending writes with the token of their latest session
+    bind_token(st.session_state.username, st.session_state.token)
+
+# Every run is a trace (see run_scope); callbacks and fragment reruns open their own
+with run_scope("rerun", started=RUN_STARTED):
+    if diagnostics_requested():
+        render_diagnostics_page()
+    elif st.session_state.logged_in:
+        strings = APP_STRINGS[st.session_state.lang]
+
+        # Degraded mode: the circuit breaker is skipping API calls for a while
+        breaker = breaker_state()
+        if breaker['state'] != "closed":
+            st.warning(f"⚠️ La API no responde. Mostrando los últimos datos disponibles "
+                       f"(reintento en {breaker['retry_in']:.0f} s).")
+
+        # Only the selected page is rendered; its id lives in st.session_state.page
+        pages = [
+            ("home", f"🌿 {strings['home_button']}", render_home_content),
+            ("history", f"📝 {strings['history_button']}", render_history_content),
+            ("achievements", f"⭐ {strings['achievements_button']}", render_achievements_content),
+            ("profile", f"🧑‍🌾 {strings['profile_button']}", render_profile_content),
+            ("guide", f"🧭 Guía", render_guide_content),
+        ]
+        page_labels = {page: label for page, label, _ in pages}
+        if st.session_state.page not in page_labels:
+            st.session_state.page = "home"
+        st.session_state.nav_tabs = page_labels[st.session_state.page]
+
+        # Use st.tabs for navigation
+        tabs = st.tabs(list(page_labels.values()), key="nav_tabs", on_change=sync_page_from_tabs,
+                       args=({label: page for page, label in page_labels.items()},))
+
+        for (page, _, render_page), tab in zip(pages, tabs):
+            if page != st.session_state.page:
+                continue
+            with tab:
+                # Centrar el contenido de la página dentro de la pestaña
+                col_main_left, col_main_center, col_main_right = st.columns([1, 4, 1])
+                with col_main_center:
+                    render_page()
     else:
-        render_login_page()
+        if st.session_state.page == "welcome":
+            render_welcome_page()
+        else:
+            render_login_page()
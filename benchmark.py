@@ -0,0 +1,175 @@
+# benchmark.py (Benchmark de reruns de app.py sin red)
+#
+# Ejecuta cada página de app.py sin navegador (streamlit.testing.v1.AppTest)
+# contra la API local de stub_api.py y mide, por página:
+#
+#   - rerun en frío: sesión nueva con las cachés del proceso vacías (catálogo,
+#     últimos datos conocidos, índice de búsqueda);
+#   - reruns en caliente: las siguientes ejecuciones de la misma sesión;
+#   - peticiones a la API por rerun (intentos de red, según metrics.py).
+#
+#   python benchmark.py --runs 10 --logs 500 --latency 30
+#   python benchmark.py --json bench.json                  # guarda los resultados
+#   python benchmark.py --baseline bench.json              # falla si algo empeora
+#
+# Con --api-url se mide contra otra API (usuario y contraseña con --user/--password).
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# (página, requiere sesión iniciada)
+PAGES = [
+    ("welcome", False),
+    ("login", False),
+    ("home", True),
+    ("history", True),
+    ("profile", True),
+    ("guide", True),
+]
+
+
+def _requests_sent():
+    from metrics import snapshot
+    return sum(summary["count"] for summary in snapshot()["endpoints"].values())
+
+
+def _reset_process_caches():
+    from catalog import invalidate_catalog
+    from dashboard import forget_dashboard_data
+    import food_search
+
+    invalidate_catalog()
+    forget_dashboard_data()
+    food_search._indexes.clear()
+
+
+def _new_session(page, logged_in, user):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state.page = page
+    if logged_in:
+        at.session_state.logged_in = True
+        at.session_state.token = user["token"]
+        at.session_state.username = user["username"]
+        at.session_state.full_name = user["full_name"]
+    return at
+
+
+def _timed_run(at):
+    sent = _requests_sent()
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"app.py raised: {at.exception[0].value}")
+    return 1000 * elapsed, _requests_sent() - sent
+
+
+def bench_page(page, logged_in, user, runs):
+    """Returns the cold and warm timings of one page."""
+    _reset_process_caches()
+    at = _new_session(page, logged_in, user)
+    cold_ms, cold_requests = _timed_run(at)
+    warm = [_timed_run(at) for _ in range(runs)]
+    warm_ms = sorted(ms for ms, _ in warm)
+    return {
+        "page": page,
+        "cold_ms": round(cold_ms, 1),
+        "cold_requests": cold_requests,
+        "warm_p50_ms": round(statistics.median(warm_ms), 1) if warm_ms else None,
+        "warm_p95_ms": round(warm_ms[min(len(warm_ms) - 1, int(0.95 * len(warm_ms)))], 1) if warm_ms else None,
+        "warm_requests_per_rerun": round(sum(n for _, n in warm) / len(warm), 2) if warm else None,
+    }
+
+
+def print_table(results):
+    header = f"{'página':<10} {'frío ms':>9} {'frío req':>9} {'p50 ms':>9} {'p95 ms':>9} {'req/rerun':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['page']:<10} {r['cold_ms']:>9} {r['cold_requests']:>9} {r['warm_p50_ms']:>9} "
+              f"{r['warm_p95_ms']:>9} {r['warm_requests_per_rerun']:>10}")
+
+
+def compare(results, baseline, tolerance):
+    """Returns the list of regressions against a previous --json output."""
+    previous = {r["page"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = previous.get(r["page"])
+        if old is None:
+            continue
+        for key in ("cold_ms", "warm_p50_ms"):
+            if old[key] and r[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{r['page']}: {key} {old[key]} -> {r[key]}")
+        for key in ("cold_requests", "warm_requests_per_rerun"):
+            if r[key] > old[key]:
+                regressions.append(f"{r['page']}: {key} {old[key]} -> {r[key]}")
+    return regressions
+
+
+def _start_stub(args):
+    import stub_api
+
+    state = stub_api.StubState(latency=args.latency / 1000, jitter=args.jitter / 1000,
+                               error_rate=args.error_rate, categories=not args.no_categories, seed=0)
+    state.seed(args.user, args.logs, password=args.password)
+    _, url = stub_api.start_in_background(state)
+    return url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de reruns de app.py contra una API local.")
+    parser.add_argument("--runs", type=int, default=5, help="reruns en caliente por página")
+    parser.add_argument("--pages", nargs="+", choices=[page for page, _ in PAGES], help="páginas a medir")
+    parser.add_argument("--logs", type=int, default=200, help="registros del usuario de prueba")
+    parser.add_argument("--latency", type=float, default=0.0, help="latencia simulada de la API, en ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variación de la latencia, en ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    parser.add_argument("--no-categories", action="store_true", help="catálogo sin categorías (métricas remotas)")
+    parser.add_argument("--api-url", help="medir contra esta API en lugar de arrancar stub_api.py")
+    parser.add_argument("--user", default="bench")
+    parser.add_argument("--password", default="stub")
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    parser.add_argument("--baseline", help="resultados anteriores (--json) con los que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="empeoramiento de tiempos tolerado")
+    args = parser.parse_args()
+
+    # Sin tocar los datos locales de la app: instantáneas, cola y trazas van a un temporal
+    os.environ.setdefault("NUTRIGOAL_DATA_DIR", tempfile.mkdtemp(prefix="nutrigoal-bench-"))
+    os.environ.setdefault("NUTRIGOAL_METRICS_DUMP_INTERVAL", "0")
+    import api_client
+
+    api_client.API_URL = args.api_url.rstrip("/") if args.api_url else _start_stub(args)
+    response = api_client.api_post("/api/login", json={"username": args.user, "password": args.password})
+    if response.status_code != 200:
+        sys.exit(f"No se pudo iniciar sesión como '{args.user}': {response.status_code}")
+    user = {"username": args.user, "token": response.json()["token"],
+            "full_name": response.json().get("full_name", "")}
+
+    selected = [(page, logged_in) for page, logged_in in PAGES if not args.pages or page in args.pages]
+    results = [bench_page(page, logged_in, user, args.runs) for page, logged_in in selected]
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESIÓN", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# caches.py (Frontend - Cachés acotadas del proceso)
+#
+# Un proceso de Streamlit atiende a todas las sesiones, así que cada caché de
+# módulo (catálogo, últimos datos conocidos de cada usuario, índices de búsqueda,
+# copias de respuestas condicionales...) acumularía datos de todas las sesiones
+# que se hayan conectado alguna vez. Todas esas cachés son BoundedCache:
+#
+#   - LRU con un máximo de entradas y, opcionalmente, caducidad (TTL) por caché;
+#   - un presupuesto de bytes común a todas (NUTRIGOAL_CACHE_BUDGET_MB): al
+#     pasarlo se expulsa la entrada usada hace más tiempo, sea de la caché que sea;
+#   - contadores por caché (entradas, bytes, aciertos, fallos, expulsiones...)
+#     que se ven en la vista de diagnóstico y en metrics.py.
+#
+# Los tamaños son estimaciones (estimate_size: sys.getsizeof de todo lo
+# alcanzable, una vez por objeto) calculadas al guardar cada entrada.
+#
+# Las entradas de un usuario llevan su token como "dueño". Al cerrar sesión se
+# liberan todas (release_owner) y cada sesión con la sesión iniciada guarda un
+# CacheLease en st.session_state: cuando Streamlit descarta una sesión
+# desconectada, el lease se recoge y, si ninguna otra sesión usa ese token, sus
+# entradas se liberan también. El finalizador del lease puede ejecutarse en
+# cualquier momento (el recolector salta dentro de otro código, incluso con _lock
+# tomado y a mitad de recorrer una caché), así que solo anota el dueño en
+# _dropped_leases; la cuenta se descuenta en la siguiente operación que toma _lock.
+# Otros módulos pueden enterarse de que un dueño se ha quedado sin sesiones
+# (on_owner_released), p. ej. para olvidar su token.
+
+import os
+import sys
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+
+# Presupuesto de memoria común a todas las cachés
+CACHE_BUDGET_BYTES = int(float(os.environ.get("NUTRIGOAL_CACHE_BUDGET_MB", "256")) * 2 ** 20)
+
+_lock = threading.RLock()
+_registry = {}  # nombre -> BoundedCache
+_total_bytes = 0
+_leases = {}  # dueño -> número de sesiones que lo usan
+_dropped_leases = []  # dueños de leases recogidos, pendientes de descontar
+_release_listeners = []  # funciones a las que se avisa cuando un dueño pierde su último lease
+_MISSING = object()
+
+
+def estimate_size(obj, exclude=()):
+    """Approximate bytes of obj and everything it references, counting each object once.
+
+    Objects in ``exclude`` (and whatever is only reachable through them) are not
+    counted. Attributes a class lists in ``_shared_attributes`` are skipped too.
+    """
+    seen = {id(item) for item in exclude}
+    stack, total = [obj], 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__") and not isinstance(current, (type, array)):
+            shared = getattr(type(current), "_shared_attributes", ())
+            stack.extend(value for key, value in vars(current).items() if key not in shared)
+    return total
+
+
+class _Entry:
+    __slots__ = ("value", "size", "owner", "expires_at", "used_at")
+
+    def __init__(self, value, size, owner, expires_at):
+        self.value = value
+        self.size = size
+        self.owner = owner
+        self.expires_at = expires_at
+        self.used_at = time.monotonic()
+
+
+class BoundedCache:
+    """Thread-safe LRU cache with optional TTL, accounted against the process budget."""
+
+    def __init__(self, name, max_entries=None, ttl=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.released = 0
+        with _lock:
+            _registry[name] = self
+
+    def _remove(self, key):
+        global _total_bytes
+        entry = self._data.pop(key)
+        self.bytes -= entry.size
+        _total_bytes -= entry.size
+        return entry
+
+    def _expired(self, entry, now):
+        return entry.expires_at is not None and now >= entry.expires_at
+
+    def get(self, key, default=None):
+        """Returns the cached value (and marks it as recently used), or default."""
+        now = time.monotonic()
+        with _lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            entry.used_at = now
+            self.hits += 1
+            return entry.value
+
+    def set(self, key, value, owner=None, size=None):
+        """Stores value, evicting old entries if needed; returns False if it does not fit at all.
+
+        ``owner`` (a user's token) lets release_owner drop the entry, and
+        ``size`` overrides the estimate when the caller knows it better.
+        """
+        global _total_bytes
+        size = estimate_size(value) if size is None else size
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with _lock:
+            _drain_dropped_leases()
+            if key in self._data:
+                self._remove(key)
+            if size > CACHE_BUDGET_BYTES:
+                self.evictions += 1
+                return False
+            self._data[key] = _Entry(value, size, owner, expires_at)
+            self.bytes += size
+            _total_bytes += size
+            while self.max_entries is not None and len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            _enforce_budget()
+        return True
+
+    def setdefault(self, key, value, owner=None):
+        """Returns the cached value for key, storing value first if there is none."""
+        with _lock:
+            current = self.get(key, _MISSING)
+            if current is not _MISSING:
+                return current
+            self.set(key, value, owner)
+            return value
+
+    def pop(self, key, default=None):
+        with _lock:
+            if key not in self._data:
+                return default
+            return self._remove(key).value
+
+    def release(self, owner):
+        """Drops every entry of one owner; returns how many were dropped."""
+        with _lock:
+            keys = [key for key, entry in self._data.items() if entry.owner == owner]
+            for key in keys:
+                self._remove(key)
+            self.released += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with _lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def keys(self):
+        with _lock:
+            return list(self._data)
+
+    def __contains__(self, key):
+        with _lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry, time.monotonic())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with _lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "released": self.released,
+            }
+
+
+def _purge_expired():
+    now = time.monotonic()
+    for cache in _registry.values():
+        for key in [key for key, entry in cache._data.items() if cache._expired(entry, now)]:
+            cache._remove(key)
+            cache.expirations += 1
+
+
+def _enforce_budget():
+    # Se llama con _lock tomado
+    _drain_dropped_leases()
+    if _total_bytes <= CACHE_BUDGET_BYTES:
+        return
+    _purge_expired()
+    while _total_bytes > CACHE_BUDGET_BYTES:
+        # La entrada menos usada de todas: la primera de cada caché es su LRU
+        oldest = min((cache for cache in _registry.values() if cache._data),
+                     key=lambda cache: next(iter(cache._data.values())).used_at, default=None)
+        if oldest is None:
+            return
+        oldest._remove(next(iter(oldest._data)))
+        oldest.evictions += 1
+
+
+def release_owner(owner):
+    """Drops the entries of one user (token) from every cache; returns how many were dropped."""
+    if owner is None:
+        return 0
+    with _lock:
+        _drain_dropped_leases()
+        return sum(cache.release(owner) for cache in _registry.values())
+
+
+class CacheLease:
+    """Keeps an owner's entries while some session holds a lease for it.
+
+    Store it in st.session_state: when the session is discarded the lease is
+    garbage collected and, if it was the last one for its owner, the owner's
+    entries are released.
+    """
+
+    def __init__(self, owner):
+        self.owner = owner
+        with _lock:
+            _leases[owner] = _leases.get(owner, 0) + 1
+        self._finalizer = weakref.finalize(self, _drop_lease, owner)
+
+    def close(self):
+        """Gives the lease up now instead of waiting for garbage collection."""
+        self._finalizer()
+
+
+def _drop_lease(owner):
+    # Sin _lock: list.append es atómico y no interrumpe a quien lo tenga tomado
+    _dropped_leases.append(owner)
+
+
+def _drain_dropped_leases():
+    # Se llama con _lock tomado y fuera de cualquier recorrido de las cachés
+    while _dropped_leases:
+        owner = _dropped_leases.pop()
+        remaining = _leases.get(owner, 1) - 1
+        if remaining > 0:
+            _leases[owner] = remaining
+            continue
+        _leases.pop(owner, None)
+        for cache in _registry.values():
+            cache.release(owner)
+        for listener in _release_listeners:
+            listener(owner)
+
+
+def on_owner_released(listener):
+    """Calls listener(owner) whenever the last lease of an owner is given up or collected.
+
+    The listener runs with the caches lock held: it must be quick and must not
+    use the caches.
+    """
+    with _lock:
+        _release_listeners.append(listener)
+
+
+def cache_stats():
+    """Returns {"budget_bytes", "total_bytes", "caches": {name: stats}}."""
+    with _lock:
+        _drain_dropped_leases()
+        return {
+            "budget_bytes": CACHE_BUDGET_BYTES,
+            "total_bytes": _total_bytes,
+            "caches": {name: cache.stats() for name, cache in sorted(_registry.items())},
+        }
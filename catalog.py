@@ -0,0 +1,206 @@
+# catalog.py (Frontend - Caché del catálogo de alimentos)
+#
+# El catálogo de /api/foods casi nunca cambia y es igual para todos los usuarios,
+# así que se guarda una copia por idioma para todo el proceso. Cada entrada caduca
+# pasado NUTRIGOAL_CATALOG_TTL segundos y se puede invalidar a mano con
+# invalidate_catalog().
+#
+# Carga "single-flight": si muchas sesiones encuentran la caché vacía a la vez,
+# solo una hace la petición y las demás esperan a su resultado.
+#
+# La petición es condicional (ETag / Last-Modified): al caducar el TTL, si el
+# catálogo no ha cambiado la API contesta 304 y solo viajan las cabeceras.
+#
+# Cada catálogo descargado se guarda además en disco (NUTRIGOAL_DATA_DIR) como
+# una instantánea marshal con cabecera de formato, reemplazada de forma atómica
+# (ver storage.py). Todos los procesos de Streamlit de la máquina comparten esas
+# instantáneas: un proceso recién arrancado (o cuya copia en memoria ha caducado)
+# usa la del disco si sigue dentro del TTL, sin tocar la red. El formato de
+# marshal cambia entre versiones de Python, así que la cabecera lleva la del
+# intérprete y la instantánea de otra versión se ignora.
+#
+# Las copias en memoria van en una BoundedCache (ver caches.py): si el
+# presupuesto de memoria obliga a expulsar una, se vuelve a leer de la instantánea.
+
+import hashlib
+import importlib.util
+import json
+import logging
+import marshal
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from api_client import api_get
+from caches import BoundedCache
+from storage import DATA_DIR, write_atomic
+
+# Segundos que una copia del catálogo se considera válida
+CATALOG_TTL = float(os.environ.get("NUTRIGOAL_CATALOG_TTL", "3600"))
+
+# Cabecera de las instantáneas; cambiarla invalida las escritas por versiones anteriores.
+# MAGIC_NUMBER identifica la versión del formato de marshal/bytecode del intérprete
+SNAPSHOT_MAGIC = b"NGCAT\x01" + importlib.util.MAGIC_NUMBER
+
+logger = logging.getLogger(__name__)
+
+_entries = BoundedCache("catalog")  # lang -> {"foods": [...], "by_id": {...}, "version": str, "loaded_at": float}
+_inflight = {}  # lang -> Future de la carga en curso
+_lock = threading.Lock()
+
+
+def _fetch_catalog(lang):
+    response = api_get("/api/foods", params={"lang": lang}, conditional=True)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"/api/foods -> {response.status_code}", response=response)
+    foods = response.json()
+    if not isinstance(foods, list):
+        raise ValueError("/api/foods did not return a list")
+    return foods
+
+
+def catalog_version(foods):
+    """Returns a short content hash that identifies this exact catalog."""
+    encoded = json.dumps(foods, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def _make_entry(foods, version=None, age=0.0):
+    return {
+        "foods": foods,
+        "by_id": {food['id']: food for food in foods},
+        "version": version or catalog_version(foods),
+        "loaded_at": time.monotonic() - age,
+    }
+
+
+def _snapshot_path(lang):
+    return os.path.join(DATA_DIR, f"catalog-{lang}.bin")
+
+
+def _read_snapshot(lang):
+    """Returns the cache entry stored on disk for lang, or None."""
+    try:
+        with open(_snapshot_path(lang), "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    if not raw.startswith(SNAPSHOT_MAGIC):
+        return None
+    try:
+        snapshot = marshal.loads(raw[len(SNAPSHOT_MAGIC):])
+        foods = snapshot["foods"]
+        age = max(0.0, time.time() - snapshot["saved_at"])
+        return _make_entry(foods, snapshot["version"], age)
+    except (EOFError, ValueError, TypeError, KeyError):
+        logger.warning("Ignoring unreadable catalog snapshot for %s", lang)
+        return None
+
+
+def _write_snapshot(lang, entry):
+    """Atomically replaces the snapshot for lang; failures are only logged."""
+    snapshot = {"foods": entry["foods"], "version": entry["version"], "saved_at": time.time()}
+    try:
+        write_atomic(os.path.basename(_snapshot_path(lang)), SNAPSHOT_MAGIC + marshal.dumps(snapshot), durable=True)
+    except (OSError, ValueError):
+        logger.warning("Could not write the catalog snapshot for %s", lang, exc_info=True)
+
+
+def _is_fresh(entry):
+    return entry is not None and time.monotonic() - entry["loaded_at"] < CATALOG_TTL
+
+
+def _load_entry(lang):
+    """Returns a fresh cache entry for lang, fetching it at most once at a time."""
+    with _lock:
+        entry = _entries.get(lang)
+        if _is_fresh(entry):
+            return entry
+        future = _inflight.get(lang)
+        leader = future is None
+        if leader:
+            future = _inflight[lang] = Future()
+
+    if not leader:
+        return future.result()
+
+    try:
+        # Otro proceso puede haber refrescado ya la instantánea del disco
+        entry = _read_snapshot(lang)
+        if not _is_fresh(entry):
+            entry = _make_entry(_fetch_catalog(lang))
+            _write_snapshot(lang, entry)
+        with _lock:
+            _entries.set(lang, entry)
+        future.set_result(entry)
+        return entry
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(lang, None)
+
+
+def _get_entry(lang):
+    try:
+        return _load_entry(lang)
+    except (requests.exceptions.RequestException, ValueError):
+        # Mejor servir una copia caducada (en memoria o en disco) que nada
+        stale = _entries.get(lang) or _read_snapshot(lang)
+        if stale is not None:
+            with _lock:
+                _entries.setdefault(lang, stale)
+            return stale
+        raise
+
+
+def get_catalog(lang):
+    """Returns the list of foods for lang, served from the process-wide cache.
+
+    Raises ``requests.exceptions.RequestException`` (or ``ValueError`` for a
+    malformed answer) only when there is no cached copy at all.
+    """
+    return _get_entry(lang)["foods"]
+
+
+def get_catalog_by_id(lang):
+    """Returns the catalog for lang as a dict food_id -> food.
+
+    Food ids are the same in every language, so a log's ``food_id`` can be
+    resolved to its name in whatever language the user has selected.
+    """
+    return _get_entry(lang)["by_id"]
+
+
+def get_catalog_version(lang):
+    """Returns the content hash of the catalog currently served for lang."""
+    return _get_entry(lang)["version"]
+
+
+def invalidate_catalog(lang=None):
+    """Drops the cached catalog for lang (or for every language if lang is None).
+
+    Both the in-memory copy and the on-disk snapshot are removed, so the next
+    request goes to the API in this and every other local process.
+    """
+    with _lock:
+        langs = _entries.keys() if lang is None else [lang]
+        if lang is None:
+            _entries.clear()
+        else:
+            _entries.pop(lang, None)
+    if lang is None:
+        try:
+            langs = [name[len("catalog-"):-len(".bin")] for name in os.listdir(DATA_DIR)
+                     if name.startswith("catalog-") and name.endswith(".bin")]
+        except OSError:
+            langs = []
+    for name in langs:
+        try:
+            os.unlink(_snapshot_path(name))
+        except OSError:
+            pass
@@ -0,0 +1,158 @@
+# checks.py (Comprobaciones contra la API local)
+#
+# Comprobaciones rápidas de contratos que no se ven a simple vista en la página,
+# contra la API local de stub_api.py (cada una arranca la suya):
+#
+#   - history: las páginas del historial se unen sin huecos ni duplicados, también
+#     cuando la API no pagina y devuelve la lista completa;
+#   - revalidation: al recargar, los registros se revalidan (304) y se sirven de
+#     la copia local, y un cambio en el servidor se ve en la siguiente carga;
+#   - week_rollups: los resúmenes incrementales (week_rollups.py) dan lo mismo que
+#     compute_weekly_metrics para cada primer día de la semana, también tras
+#     quitar registros al azar y con food_id grandes y dispersos.
+#
+#   python checks.py              # todas
+#   python checks.py history      # solo las indicadas
+#
+# Termina con código 1 si alguna falla.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import traceback
+
+
+def _start_stub(username, logs, **options):
+    """Starts a stub API with one seeded user, points api_client at it and returns (state, token)."""
+    import api_client
+    import stub_api
+
+    state = stub_api.StubState(seed=0, **options)
+    state.seed(username, logs)
+    token = f"stub-token-{username}"
+    state.tokens[token] = username
+    _, api_client.API_URL = stub_api.start_in_background(state)
+    return state, token
+
+
+def check_history():
+    """History pages join without gaps or duplicates, paginated or not."""
+    from dashboard import HISTORY_PAGE_SIZE, load_history_page
+    from log_store import LogStore
+
+    for pagination in (True, False):
+        username = f"history-{'pages' if pagination else 'list'}"
+        state, token = _start_stub(username, 4 * HISTORY_PAGE_SIZE + 7, pagination=pagination)
+        data = {"logs": LogStore((), {food['id']: food for food in state.foods}), "history": None}
+        pages = 1
+        load_history_page(data, token)
+        while data["history"]["next_cursor"] is not None:
+            assert pages < 100, "the history cursor never ends"
+            load_history_page(data, token)
+            pages += 1
+        log_ids = [log['log_id'] for log in data["history"]["logs"]]
+        expected = [log['log_id'] for log in state.user_logs(username)]
+        assert len(set(log_ids)) == len(log_ids), f"duplicated logs across {pages} pages"
+        assert log_ids == expected, f"{len(log_ids)} logs in {pages} pages, expected {len(expected)}"
+        assert pages == (5 if pagination else 1), f"{pages} pages"
+
+
+def check_revalidation():
+    """A warm reload gets 304s for the logs and the same data; a server change shows up."""
+    from dashboard import load_dashboard_data, load_history_page
+
+    username = "revalidation"
+    state, token = _start_stub(username, 300)
+    cold = load_dashboard_data(token, "es")
+    load_history_page(cold, token)
+    before = state.stats["not_modified"]
+
+    warm = load_dashboard_data(token, "es")
+    load_history_page(warm, token)
+    assert not cold["errors"] and not warm["errors"], (cold["errors"], warm["errors"])
+    assert state.stats["not_modified"] >= before + 2, f"{state.stats['not_modified'] - before} answers were 304"
+    assert list(warm["logs"]) == list(cold["logs"]), "the week's logs changed on a 304"
+    assert list(warm["history"]["logs"]) == list(cold["history"]["logs"]), "the history changed on a 304"
+
+    state.add_log(username, state.foods[0]['id'])
+    changed = load_dashboard_data(token, "es")
+    assert len(changed["logs"]) == len(cold["logs"]) + 1, "a new log was served from the stale copy"
+
+
+def check_week_rollups():
+    """Incremental week rollups match compute_weekly_metrics for every week start, after random removals."""
+    from datetime import date, timedelta
+
+    import stub_api
+    from log_store import LogStore
+    from week_rollups import WeeklyRollups
+    from weekly_metrics import compute_weekly_metrics
+
+    rng = random.Random(0)
+    # Ids grandes y con huecos: los bits deben ser posiciones, no food_id
+    foods = [dict(food, id=food['id'] * 1_000_003) for food in stub_api.StubState().foods]
+    foods_by_id = {food['id']: food for food in foods}
+    today = date.today()
+    logs = []
+    for log_id in range(1, 601):
+        food = rng.choice(foods)
+        log = {"log_id": log_id, "food_id": food['id'], "food_name": food['name'],
+               "date_consumed": (today - timedelta(days=rng.randrange(28))).isoformat()}
+        if log_id % 50 == 0:
+            log['food_id'] = None  # se une al catálogo por el nombre
+        elif log_id % 75 == 0:
+            log['food_id'], log['food_name'] = -1, "No está en el catálogo"
+        logs.append(log)
+
+    for week_start in range(7):
+        store = LogStore(logs, foods_by_id)
+        rollups = store.attach_rollups(WeeklyRollups(foods_by_id, week_start))
+        for _ in range(4):
+            store.remove_indices(rng.sample(range(len(store)), len(store) // 10))
+            for day in (today - timedelta(days=offset) for offset in (0, 3, 9, 20)):
+                expected = compute_weekly_metrics(list(store), foods, day, week_start)
+                expected["last_week_vegetable_count"] = compute_weekly_metrics(
+                    list(store), foods, day - timedelta(days=7), week_start)["vegetable_count"]
+                got = rollups.weekly_metrics(day)
+                assert got == expected, f"week_start={week_start} day={day}: {got} != {expected}"
+                eaten = set(got["vegetables"])
+                missing = [food['name'] for food in rollups.not_eaten(day)]
+                assert not eaten & set(missing), f"week_start={week_start} day={day}: eaten and not eaten"
+        assert rollups.mask().bit_length() == len(foods), "the bitsets are not dense"
+
+
+CHECKS = {
+    "history": check_history,
+    "revalidation": check_revalidation,
+    "week_rollups": check_week_rollups,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprobaciones contra la API local.")
+    parser.add_argument("checks", nargs="*", help=f"comprobaciones a ejecutar ({', '.join(CHECKS)})")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"comprobaciones desconocidas: {', '.join(unknown)}")
+
+    os.environ.setdefault("NUTRIGOAL_DATA_DIR", tempfile.mkdtemp(prefix="nutrigoal-checks-"))
+    os.environ.setdefault("NUTRIGOAL_METRICS_DUMP_INTERVAL", "0")
+
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        try:
+            CHECKS[name]()
+        except Exception:
+            failed += 1
+            print(f"FALLO {name}")
+            traceback.print_exc()
+        else:
+            print(f"ok    {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
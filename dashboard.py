@@ -0,0 +1,586 @@
+# dashboard.py (Frontend - Carga de datos de la página de inicio)
+#
+# La página de inicio necesita varios recursos independientes de la API. En lugar
+# de pedirlos uno detrás de otro, se lanzan a la vez en un pool de hilos acotado y
+# se reúnen en un único diccionario que lee render_home_content.
+#
+# Siempre que el catálogo trae categorías, las métricas semanales (progreso,
+# vegetales, prebióticos, probióticos) se calculan en local a partir de los
+# registros del usuario en vez de pedir cinco endpoints. Se piden los registros
+# desde el principio de la semana anterior y se resumen por semana en un
+# WeeklyRollups (ver week_rollups.py) que cada alta o baja actualiza en O(1), sin
+# volver a recorrer los registros; así también se compara con la semana pasada.
+#
+# Las listas de la semana (vegetales, prebióticos, probióticos) se muestran en
+# expanders cerrados por defecto. Si hay que pedirlas al servidor, solo se piden
+# cuando el usuario abre su sección (load_dashboard_list) y se memorizan.
+#
+# El historial completo no se carga nunca de una vez: las métricas solo necesitan
+# los registros de esta semana y la anterior (se piden páginas hasta llegar al
+# primer día) y la página de historial pide páginas de NUTRIGOAL_HISTORY_PAGE_SIZE
+# registros a medida que el usuario las solicita.
+#
+# El resultado se guarda por sesión (st.session_state.user_data) y se actualiza
+# en el sitio tras cada alta, baja o cambio de objetivo (apply_*), así que el
+# rerun que sigue a una escritura no hace ninguna petición GET. Cada
+# NUTRIGOAL_RECONCILE_INTERVAL segundos se vuelve a cargar todo en segundo plano
+# para reconciliar con el servidor; los registros se piden de forma condicional
+# (ETag), así que si no han cambiado esa recarga solo intercambia cabeceras.
+#
+# Los registros (los de la semana y las páginas de historial) se guardan en un
+# LogStore (ver log_store.py): columnas de enteros en lugar de una lista de dicts.
+#
+# Las altas y bajas que no llegan a la API esperan en la cola local de
+# write_queue.py; apply_queued_ops las superpone a los datos (las altas como
+# registros ``pending``) hasta que se envían, y aún después, hasta que una recarga
+# trae el registro del servidor (por su log_id, ver write_queue.sent_adds): así
+# los contadores no bajan entre el envío y la reconciliación.
+#
+# Stale-while-revalidate: la página nunca espera a esa recarga. Se pinta con los
+# últimos datos conocidos (también los de otra sesión del mismo usuario en este
+# proceso, ver last_known_dashboard_data) y el fragmento del panel se vuelve a
+# ejecutar cada NUTRIGOAL_REFRESH_POLL segundos hasta recoger los datos nuevos.
+# Esos últimos datos conocidos viven en una BoundedCache (ver caches.py) de como
+# mucho NUTRIGOAL_LAST_KNOWN_MAX usuarios, durante NUTRIGOAL_LAST_KNOWN_TTL segundos.
+# Cada escritura de la sesión la descarta (la copia ya no es la última conocida)
+# y una sesión que arranca de ella la reconcilia en su primera ejecución.
+#
+# Los hilos del pool no tienen contexto de Streamlit, así que aquí no se llama a
+# ninguna función ``st.*``: los fallos se anotan en ``errors`` y la página decide
+# cómo mostrarlos.
+
+import contextvars
+import copy
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+import api_client
+from api_client import IDEMPOTENCY_HEADER, api_get, api_post, request_scope
+from caches import BoundedCache, estimate_size
+from catalog import get_catalog, get_catalog_by_id
+from log_store import LogStore
+from week_rollups import WeeklyRollups
+from weekly_metrics import parse_log_date, supports_local_metrics, week_bounds
+
+# Número máximo de peticiones simultáneas (compartido por todas las sesiones)
+DASHBOARD_WORKERS = int(os.environ.get("NUTRIGOAL_DASHBOARD_WORKERS", "8"))
+
+# Segundos entre reconciliaciones en segundo plano de los datos de la sesión
+RECONCILE_INTERVAL = float(os.environ.get("NUTRIGOAL_RECONCILE_INTERVAL", "300"))
+# Si la última carga tuvo errores se reintenta antes, pero no en cada rerun
+ERROR_RETRY_INTERVAL = min(RECONCILE_INTERVAL, float(os.environ.get("NUTRIGOAL_ERROR_RETRY_INTERVAL", "30")))
+
+# Segundos entre comprobaciones del panel mientras hay una recarga en curso
+REFRESH_POLL_INTERVAL = float(os.environ.get("NUTRIGOAL_REFRESH_POLL", "1.5"))
+
+# Registros por página en la pestaña de historial
+HISTORY_PAGE_SIZE = int(os.environ.get("NUTRIGOAL_HISTORY_PAGE_SIZE", "50"))
+# Registros por página al cargar las dos últimas semanas para las métricas
+WEEK_LOGS_PAGE_SIZE = int(os.environ.get("NUTRIGOAL_WEEK_LOGS_PAGE_SIZE", "200"))
+
+# Segundos sin volver a probar el endpoint de lotes de una API que contestó que no lo tiene
+BATCH_RETRY_INTERVAL = float(os.environ.get("NUTRIGOAL_BATCH_RETRY_INTERVAL", "600"))
+
+# Usuarios (por idioma) cuyos últimos datos se conservan, y durante cuántos segundos
+LAST_KNOWN_MAX = int(os.environ.get("NUTRIGOAL_LAST_KNOWN_MAX", "500"))
+LAST_KNOWN_TTL = float(os.environ.get("NUTRIGOAL_LAST_KNOWN_TTL", "3600"))
+
+# Valores por defecto si una petición falla
+DASHBOARD_DEFAULTS = {
+    "goal": 30,
+    "vegetable_count": 0,
+    "vegetables": [],
+    "diversity": {"prebiotic_count": 0, "probiotic_count": 0},
+    "prebiotics": [],
+    "probiotics": [],
+    "foods": [],
+    "suggestions": [],
+    "logs": [],
+}
+
+_executor = None
+_reconcile_executor = None
+_executor_lock = threading.Lock()
+
+# (token, lang) -> copia de la última carga completa; el token es el dueño de la entrada
+_last_known = BoundedCache("last_known", max_entries=LAST_KNOWN_MAX, ttl=LAST_KNOWN_TTL)
+
+# URL de la API -> True si contestó 404/405 al endpoint de lotes; caduca para volver a probarlo
+_batch_unsupported = BoundedCache("batch_unsupported", max_entries=8, ttl=BATCH_RETRY_INTERVAL)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS,
+                                               thread_name_prefix="dashboard")
+    return _executor
+
+
+def _get_reconcile_executor():
+    # Pool aparte: una reconciliación espera a tareas del pool principal y no debe ocuparlo
+    global _reconcile_executor
+    if _reconcile_executor is None:
+        with _executor_lock:
+            if _reconcile_executor is None:
+                _reconcile_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reconcile")
+    return _reconcile_executor
+
+
+def _submit(fn, *args):
+    # Copiar el contexto hace que el hilo del pool use el request_scope del rerun
+    return _get_executor().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _fetch_json(path, token=None, params=None, conditional=False):
+    """GETs a path and returns the decoded JSON, raising on any non-200 answer."""
+    response = api_get(path, token, params=params, conditional=conditional)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"{path} -> {response.status_code}", response=response)
+    return response.json()
+
+
+def _goal(token, lang):
+    return _fetch_json("/api/user/goal", token).get('weekly_vegetable_goal', 30)
+
+
+def _vegetable_count(token, lang):
+    return _fetch_json("/api/user_progress", token).get('vegetable_count', 0)
+
+
+def _diversity(token, lang):
+    metrics = _fetch_json("/api/diversity_metrics", token)
+    return {
+        "prebiotic_count": metrics.get('prebiotic_count', 0),
+        "probiotic_count": metrics.get('probiotic_count', 0),
+    }
+
+
+def _foods(token, lang):
+    return get_catalog(lang)
+
+
+def _week_logs(token, lang):
+    # Esta semana y la anterior, para comparar. La API real ignora ``since``, así
+    # que se piden páginas del historial (de la más reciente a la más antigua) hasta
+    # pasar del primer día; ``since`` solo ahorra las páginas de más en la que sí lo
+    # entiende. Una API sin paginación devuelve todo en una sola lista.
+    first_day, _ = week_bounds(date.today() - timedelta(days=7))
+    logs, cursor = [], None
+    while True:
+        page, cursor = fetch_food_logs_page(token, limit=WEEK_LOGS_PAGE_SIZE, cursor=cursor,
+                                            since=first_day.isoformat())
+        days = [parse_log_date(log.get('date_consumed')) for log in page]
+        logs.extend(log for log, day in zip(page, days) if day is None or day >= first_day)
+        known = [day for day in days if day is not None]
+        if cursor is None or not page or (known and known[-1] < first_day):
+            return logs
+
+
+DASHBOARD_FETCHES = {
+    "goal": _goal,
+    "vegetable_count": _vegetable_count,
+    "vegetables": lambda token, lang: _fetch_json("/api/user_vegetables", token),
+    "diversity": _diversity,
+    "prebiotics": lambda token, lang: _fetch_json("/api/user_prebiotics", token),
+    "probiotics": lambda token, lang: _fetch_json("/api/user_probiotics", token),
+    "foods": _foods,
+    "suggestions": lambda token, lang: _fetch_json("/api/suggested_foods", token),
+    "logs": _week_logs,
+}
+
+# Recursos que se piden siempre; las métricas salen de "logs" o de los endpoints remotos
+BASE_KEYS = ["goal", "foods", "suggestions"]
+REMOTE_METRIC_KEYS = ["vegetable_count", "diversity"]
+LAZY_LIST_KEYS = ["vegetables", "prebiotics", "probiotics"]
+
+
+def _default(key):
+    value = DASHBOARD_DEFAULTS[key]
+    return value.copy() if isinstance(value, (dict, list)) else value
+
+
+def _collect(futures, data):
+    for key, future in futures.items():
+        try:
+            value = future.result()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            data["errors"][key] = str(e)
+            value = _default(key)
+        # La API puede devolver un dict de error en vez de una lista
+        if not isinstance(value, type(DASHBOARD_DEFAULTS[key])):
+            value = _default(key)
+        data[key] = value
+
+
+def load_dashboard_data(token, lang):
+    """Fetches the home page resources concurrently.
+
+    Returns a dict with one entry per key of ``DASHBOARD_DEFAULTS`` plus an
+    ``errors`` dict (key -> message) for the requests that failed. Failed or
+    malformed entries fall back to ``DASHBOARD_DEFAULTS``, so the render code can
+    read every key without checking.
+
+    The weekly metrics are derived from the logs and the catalog when possible,
+    so a normal load is four requests (goal, foods, suggestions, logs) and the
+    catalog usually comes from the process-wide cache.
+    """
+    data = {"errors": {}, "load_started": time.monotonic()}
+    futures = {key: _submit(DASHBOARD_FETCHES[key], token, lang) for key in BASE_KEYS}
+
+    # El catálogo suele venir de la caché, así que esta espera es casi nula.
+    # Si no permite calcular las métricas, se piden al servidor.
+    _collect({"foods": futures.pop("foods")}, data)
+    local_metrics = supports_local_metrics(data["foods"])
+    metric_keys = ["logs"] if local_metrics else REMOTE_METRIC_KEYS
+    futures.update({key: _submit(DASHBOARD_FETCHES[key], token, lang) for key in metric_keys})
+    _collect(futures, data)
+    data.setdefault("logs", _default("logs"))
+    data["logs"] = LogStore(data["logs"], _foods_by_id(data["foods"], lang))
+    data["last_week_vegetable_count"] = None
+
+    if local_metrics:
+        rollups = data["logs"].attach_rollups(WeeklyRollups(data["logs"].foods_by_id))
+        if "logs" in data["errors"]:
+            for key in REMOTE_METRIC_KEYS + LAZY_LIST_KEYS:
+                data[key] = _default(key)
+        else:
+            data.update(rollups.weekly_metrics())
+    else:
+        data.update({key: _default(key) for key in LAZY_LIST_KEYS})
+    data["lists_loaded"] = set()
+    data["history"] = None
+    data["lang"] = lang
+    data["local_metrics"] = local_metrics
+    data["loaded_at"] = time.monotonic()
+    data["version"] = 0
+    if not data["errors"]:
+        known = _copy_data(data)
+        # El catálogo no cuenta: ya está en la caché "catalog"
+        _last_known.set((token, lang), known, owner=token, size=estimate_size(known, exclude=[known["foods"]]))
+    return data
+
+
+def _foods_by_id(foods, lang):
+    # Si foods es el catálogo en caché se reutiliza su dict by_id, compartido por todas las sesiones
+    try:
+        if get_catalog(lang) is foods:
+            return get_catalog_by_id(lang)
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    return {food['id']: food for food in foods}
+
+
+def _copy_data(data):
+    # El catálogo es el mismo para todas las sesiones: no se duplica en cada copia
+    return copy.deepcopy(data, {id(data["foods"]): data["foods"]})
+
+
+def last_known_dashboard_data(token, lang):
+    """Returns a copy of the last successful load for this user, or None.
+
+    The copy is marked as due (``loaded_at = 0``), so the first ``reconcile``
+    of the session that uses it revalidates it in the background.
+    """
+    data = _last_known.get((token, lang))
+    if data is None:
+        return None
+    data = _copy_data(data)
+    data["loaded_at"] = 0
+    return data
+
+
+def forget_dashboard_data(token=None):
+    """Drops the last known data of one user (every language), or of everyone if token is None."""
+    if token is None:
+        _last_known.clear()
+    else:
+        _last_known.release(token)
+
+
+# --- Caché de sesión con escritura directa ---
+
+def _mark_written(data, token):
+    data["version"] = data.get("version", 0) + 1
+    # La copia de la última carga ya no refleja los datos del usuario
+    _last_known.pop((token, data["lang"]))
+    if data["local_metrics"]:
+        # Los resúmenes ya se han actualizado con cada registro que ha entrado o salido
+        data.update(data["logs"].rollups.weekly_metrics())
+    else:
+        # Sin categorías no se pueden recalcular las métricas: reconciliar cuanto antes
+        data["loaded_at"] = 0
+        data["lists_loaded"].clear()
+
+
+def load_dashboard_list(data, key, token, lang):
+    """Returns one of the weekly lists (``LAZY_LIST_KEYS``), fetching it on first use.
+
+    With local metrics the lists are already computed. Otherwise the list is
+    requested the first time its section is opened and memoized in ``data``.
+    """
+    if data["local_metrics"] or key in data["lists_loaded"]:
+        return data[key]
+    data["errors"].pop(key, None)
+    _collect({key: _submit(DASHBOARD_FETCHES[key], token, lang)}, data)
+    if key not in data["errors"]:
+        data["lists_loaded"].add(key)
+    return data[key]
+
+
+def _insert_added_log(data, food_id, response_json):
+    """Inserts one new log in the session data and returns its log_id (None if unknown)."""
+    response_json = response_json if isinstance(response_json, dict) else {}
+    food = next((f for f in data["foods"] if f['id'] == food_id), {})
+    log_id = response_json.get('log_id', response_json.get('id'))
+    log = {
+        "log_id": log_id,
+        "food_id": food_id,
+        "food_name": response_json.get('food_name', food.get('name', '')),
+        "date_consumed": response_json.get('date_consumed', date.today().isoformat()),
+    }
+    data["logs"].insert(0, log)
+    if data["history"] is not None:
+        data["history"]["logs"].insert(0, log)
+    # Las sugerencias son alimentos que aún no se han comido esta semana
+    data["suggestions"] = [f for f in data["suggestions"] if f.get('id') != food_id]
+    return log_id
+
+
+def apply_added_log(data, token, food_id, response_json=None):
+    """Applies a successful POST /api/user_food_logs to the session data.
+
+    The new log is built from the answer (``log_id``) and the catalog. If the
+    server did not return the id, the log is shown without it and a reconcile
+    is scheduled right away to pick up the real one.
+    """
+    apply_added_logs(data, token, [(food_id, response_json)])
+
+
+def apply_added_logs(data, token, added):
+    """Applies several added logs, given as (food_id, response_json) pairs.
+
+    The weekly metrics are recomputed once for the whole batch.
+    """
+    if not added:
+        return
+    missing_ids = [_insert_added_log(data, food_id, response_json) is None for food_id, response_json in added]
+    _mark_written(data, token)
+    if any(missing_ids):
+        data["loaded_at"] = 0
+
+
+def apply_deleted_log(data, token, log_id):
+    """Removes a log deleted with DELETE /api/user_food_logs/<log_id>."""
+    data["logs"].discard(log_id)
+    if data["history"] is not None:
+        data["history"]["logs"].discard(log_id)
+    _mark_written(data, token)
+
+
+def _overlay_queued(logs, pending_adds, queued_deletes):
+    """Updates a LogStore in place: pending rows for pending_adds only, queued deletes hidden.
+
+    Returns (changed, op keys of the pending rows it dropped).
+    """
+    known_keys = {log['op_key']: index for index, log in logs.pending()}
+    dropped = {key: index for key, index in known_keys.items() if key not in pending_adds}
+    deleted = logs.indices_of(queued_deletes)
+    logs.remove_indices(list(dropped.values()) + deleted)
+    added = 0
+    for key, op in pending_adds.items():
+        if key not in known_keys:
+            logs.insert(0, {"log_id": None, "food_id": op['food_id'], "food_name": op['food_name'],
+                            "date_consumed": op['day'], "pending": True, "op_key": key})
+            added += 1
+    return bool(dropped or deleted or added), set(dropped)
+
+
+def apply_queued_ops(data, token, ops, sent=None):
+    """Shows the operations waiting in the local write queue (see write_queue.py).
+
+    Queued adds appear as logs with ``pending=True`` and queued deletes are
+    hidden. An add the flusher already sent (``sent``, see write_queue.sent_adds)
+    stays pending, with a reconcile scheduled, until a reload brings its server
+    copy (same ``log_id``), which then also goes into the loaded history pages.
+    A reload that started after the send and lacks it means it was deleted
+    meanwhile. Does nothing (and keeps the version) when the data already
+    reflects the queue.
+    """
+    sent = sent or {}
+    queued_adds = {op['op_key']: op for op in ops if op['kind'] == "add"}
+    queued_deletes = {op['log_id'] for op in ops if op['kind'] == "delete"}
+
+    waiting, arrived = {}, []
+    for key, op in sent.items():
+        found = data["logs"].indices_of([op['log_id']])
+        if found:
+            arrived.append(data["logs"][found[0]])
+        elif op['log_id'] not in queued_deletes and (op['sent_at'] > data["load_started"] or "logs" in data["errors"]):
+            waiting[key] = op
+
+    changed = False
+    if data["history"] is not None:
+        history_logs = data["history"]["logs"]
+        for log in arrived:
+            if not history_logs.indices_of([log['log_id']]):
+                history_logs.insert(0, log)
+                changed = True
+
+    pending_adds = {**queued_adds, **waiting}
+    logs_changed, dropped = _overlay_queued(data["logs"], pending_adds, queued_deletes)
+    changed = changed or logs_changed
+    if data["history"] is not None:
+        history_changed, history_dropped = _overlay_queued(data["history"]["logs"], pending_adds, queued_deletes)
+        changed = changed or history_changed
+        dropped |= history_dropped
+    if changed:
+        _mark_written(data, token)
+    # Sin log_id conocido (lo ha enviado otro proceso) solo la reconciliación trae el registro
+    if (waiting and not data["errors"]) or dropped - set(sent):
+        data["loaded_at"] = 0
+
+
+def apply_goal(data, token, goal):
+    """Stores a goal saved with PUT /api/user/goal."""
+    data["goal"] = goal
+    data["version"] = data.get("version", 0) + 1
+    _last_known.pop((token, data["lang"]))
+
+
+def fetch_food_logs_page(token, limit=HISTORY_PAGE_SIZE, cursor=None, since=None):
+    """Fetches one page of the user's history, newest first.
+
+    Returns ``(logs, next_cursor)``; ``next_cursor`` is None on the last page.
+    A server without pagination answers with the whole list, which is then
+    treated as a single page. ``since`` (an ISO date) is only a hint: servers
+    that ignore it return older logs too.
+    """
+    params = {"limit": limit}
+    if cursor is not None:
+        params["cursor"] = cursor
+    if since is not None:
+        params["since"] = since
+    body = _fetch_json("/api/user_food_logs", token, params=params, conditional=True)
+    if isinstance(body, list):
+        return body, None
+    if not isinstance(body, dict) or not isinstance(body.get('items'), list):
+        raise ValueError("/api/user_food_logs returned an unexpected page")
+    return body['items'], body.get('next_cursor')
+
+
+def _json_body(response):
+    try:
+        body = response.json() if response.content else {}
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
+
+
+def post_food_logs(token, items):
+    """Logs several foods, given as (food_id, idempotency_key) pairs.
+
+    Sends one POST /api/user_food_logs/batch and returns one ``(status, body)``
+    per item, in order. If the API has no batch endpoint (404/405), the foods
+    are posted one by one instead and that API's batch endpoint is not tried
+    again for ``BATCH_RETRY_INTERVAL`` seconds.
+    In that mode a connection error part-way returns ``(None, {})`` for the
+    items that were not sent. Raises ``requests.exceptions.RequestException``
+    if nothing could be sent at all.
+    """
+    api_url = api_client.API_URL
+    if api_url not in _batch_unsupported:
+        payload = {"items": [{"food_id": food_id, "idempotency_key": key} for food_id, key in items]}
+        response = api_post("/api/user_food_logs/batch", token, json=payload)
+        if response.status_code in (404, 405):
+            _batch_unsupported.set(api_url, True)
+        else:
+            body = _json_body(response)
+            results = body.get('results')
+            if response.status_code == 200 and isinstance(results, list) and len(results) == len(items):
+                return [(result.get('status'), result) if isinstance(result, dict) else (None, {})
+                        for result in results]
+            # El lote entero ha fallado (token caducado, error del servidor...)
+            return [(response.status_code, body)] * len(items)
+
+    results = []
+    for i, (food_id, key) in enumerate(items):
+        try:
+            response = api_post("/api/user_food_logs", token, json={"food_id": food_id},
+                                headers={IDEMPOTENCY_HEADER: key})
+        except requests.exceptions.RequestException:
+            if not results:
+                raise
+            results.extend([(None, {})] * (len(items) - i))
+            break
+        results.append((response.status_code, _json_body(response)))
+    return results
+
+
+def load_history_page(data, token):
+    """Loads the first history page, or the next one if some are already loaded.
+
+    The pages are kept in ``data["history"]`` ({"logs": LogStore, "next_cursor"}).
+    Raises ``requests.exceptions.RequestException`` or ``ValueError`` on failure.
+    """
+    history = data["history"]
+    if history is None:
+        logs, next_cursor = fetch_food_logs_page(token)
+        data["history"] = {"logs": LogStore(logs, data["logs"].foods_by_id), "next_cursor": next_cursor}
+    elif history["next_cursor"] is not None:
+        logs, next_cursor = fetch_food_logs_page(token, cursor=history["next_cursor"])
+        history["logs"].extend(logs)
+        history["next_cursor"] = next_cursor
+    return data["history"]
+
+
+def reconcile_due(data):
+    """True when the session data is old enough to be reloaded in the background.
+
+    A load that had errors is retried after ``ERROR_RETRY_INTERVAL`` seconds;
+    retrying it on every rerun would hammer an API that is already failing.
+    """
+    interval = ERROR_RETRY_INTERVAL if data["errors"] else RECONCILE_INTERVAL
+    return time.monotonic() - data["loaded_at"] >= interval
+
+
+def _reload(token, lang):
+    # Con un request_scope propio: la recarga no debe reutilizar respuestas del rerun
+    with request_scope():
+        return load_dashboard_data(token, lang)
+
+
+def reconcile(data, token, lang):
+    """Starts a background reload when due and returns the data to render.
+
+    A finished reload replaces ``data`` unless a write happened since it
+    started, in which case it is discarded and a new one starts later. The
+    history pages already loaded are carried over to the new data.
+    The caller must store the returned dict back in the session.
+    """
+    pending = data.get("pending")
+    if pending is not None and pending.done():
+        data["pending"] = None
+        try:
+            fresh = pending.result()
+        except Exception:
+            fresh = None
+        if fresh is not None and data["version"] == data.get("pending_version"):
+            # La recarga no pide el historial: las páginas ya cargadas ("Cargar más") se conservan
+            fresh["history"] = data["history"]
+            return fresh
+        if fresh is not None:
+            # Ha guardado como última conocida una carga anterior a la escritura
+            _last_known.pop((token, lang))
+    if data.get("pending") is None and reconcile_due(data):
+        data["pending_version"] = data["version"]
+        # Con el contexto copiado sus peticiones son spans de la traza del rerun
+        data["pending"] = _get_reconcile_executor().submit(contextvars.copy_context().run, _reload, token, lang)
+    return data
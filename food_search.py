@@ -0,0 +1,158 @@
+# food_search.py (Frontend - Búsqueda de alimentos)
+#
+# En lugar de mandar el catálogo entero a un st.selectbox, la página de inicio
+# busca mientras el usuario escribe y solo muestra los N mejores resultados.
+#
+# Para cada idioma se construye un índice una sola vez por versión del catálogo
+# (ver catalog.get_catalog_version) y lo comparten todas las sesiones del
+# proceso. Los nombres se normalizan sin tildes y en minúsculas ("Plátano" ->
+# "platano"), y las coincidencias se ordenan de mejor a peor:
+#
+#   0. nombre exacto          3. el texto aparece dentro del nombre
+#   1. prefijo del nombre     4+. nombre o palabra a 1-2 errores de distancia
+#   2. prefijo de una palabra
+#
+# Los prefijos salen de una lista ordenada (bisect) y las subcadenas y los
+# errores de tecleo de un índice de trigramas, así que no se recorre todo el
+# catálogo en cada pulsación.
+#
+# Los índices van en una BoundedCache (ver caches.py); si se expulsa uno, la
+# siguiente búsqueda lo reconstruye.
+
+import bisect
+import os
+import threading
+import unicodedata
+
+from caches import BoundedCache, estimate_size
+from catalog import get_catalog, get_catalog_version
+
+# Resultados que se muestran como máximo
+SEARCH_LIMIT = int(os.environ.get("NUTRIGOAL_SEARCH_LIMIT", "8"))
+
+_indexes = BoundedCache("search_index")  # lang -> FoodSearchIndex de la versión actual del catálogo
+_lock = threading.Lock()
+
+
+def fold(text):
+    """Lower-cases text and strips accents, so "Espárrago" matches "esparrago"."""
+    decomposed = unicodedata.normalize("NFKD", str(text).casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _within_distance(a, b, max_distance):
+    """Returns the edit distance between a and b, or None if it exceeds max_distance."""
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+
+class FoodSearchIndex:
+    """Accent- and case-insensitive search over one catalog."""
+
+    def __init__(self, foods, version=None):
+        self.version = version
+        self.foods = list(foods)
+        self.names = [fold(food['name']) for food in self.foods]
+        self.words = [name.split() for name in self.names]
+        self._alphabetical = sorted(range(len(self.foods)), key=lambda i: self.names[i])
+
+        # (clave, posición) ordenado, con el nombre completo y cada palabra
+        self._keys = sorted(
+            {(name, i) for i, name in enumerate(self.names)}
+            | {(word, i) for i, words in enumerate(self.words) for word in words}
+        )
+        self._grams = {}
+        for i, name in enumerate(self.names):
+            for gram in _trigrams(name):
+                self._grams.setdefault(gram, set()).add(i)
+
+    def _prefix_matches(self, query, scores):
+        start = bisect.bisect_left(self._keys, (query, -1))
+        for key, i in self._keys[start:]:
+            if not key.startswith(query):
+                break
+            name = self.names[i]
+            score = 0 if name == query else 1 if name.startswith(query) else 2
+            scores[i] = min(score, scores.get(i, score))
+
+    def _substring_matches(self, query, scores):
+        # Solo los trigramas interiores: el texto puede estar en mitad del nombre
+        candidates = None
+        for gram in {query[i:i + 3] for i in range(len(query) - 2)}:
+            ids = self._grams.get(gram, set())
+            candidates = ids if candidates is None else candidates & ids
+        for i in candidates or ():
+            if i not in scores and query in self.names[i]:
+                scores[i] = 3
+
+    def _fuzzy_matches(self, query, scores):
+        max_distance = 1 if len(query) <= 5 else 2
+        candidates = set()
+        for gram in _trigrams(query):
+            candidates |= self._grams.get(gram, set())
+        for i in candidates:
+            if i in scores:
+                continue
+            best = None
+            for word in [self.names[i]] + self.words[i]:
+                # Compara también con el principio de la palabra, para errores al escribir a medias
+                for target in (word, word[:len(query)]):
+                    distance = _within_distance(query, target, max_distance)
+                    if distance is not None and (best is None or distance < best):
+                        best = distance
+            if best is not None:
+                scores[i] = 3 + best
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Returns up to limit foods matching query, best matches first.
+
+        An empty query returns the first foods in alphabetical order.
+        """
+        query = fold(query)
+        if not query:
+            return [self.foods[i] for i in self._alphabetical[:limit]]
+
+        scores = {}
+        self._prefix_matches(query, scores)
+        if len(query) >= 3:
+            self._substring_matches(query, scores)
+            if len(scores) < limit:
+                self._fuzzy_matches(query, scores)
+
+        ranked = sorted(scores, key=lambda i: (scores[i], len(self.names[i]), self.names[i]))
+        return [self.foods[i] for i in ranked[:limit]]
+
+
+def get_search_index(lang):
+    """Returns the search index for lang, rebuilt only when the catalog version changes."""
+    foods = get_catalog(lang)
+    version = get_catalog_version(lang)
+    index = _indexes.get(lang)
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        index = _indexes.get(lang)
+        if index is None or index.version != version:
+            index = FoodSearchIndex(foods, version)
+            # Los alimentos son los del catálogo, que ya cuenta en su propia caché
+            _indexes.set(lang, index, size=estimate_size(index, exclude=foods))
+    return index
+
+
+def search_foods(lang, query, limit=SEARCH_LIMIT):
+    """Returns up to limit foods of the catalog in lang that match query."""
+    return get_search_index(lang).search(query, limit)
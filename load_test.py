@@ -0,0 +1,272 @@
+# load_test.py (Prueba de carga con sesiones concurrentes)
+#
+# Simula N usuarios con sesión iniciada usando app.py a la vez dentro de un mismo
+# proceso (como un proceso de `streamlit run`) contra la API local de
+# stub_api.py. Cada sesión repite un recorrido realista con pausas entre pasos:
+#
+#   inicio -> añadir un alimento -> historial -> borrar un registro -> cambiar el objetivo
+#
+# Para cada N se informa de los percentiles de tiempo de rerun, las peticiones a
+# la API por sesión y minuto y la memoria (RSS) del proceso, para dimensionar
+# cuántas réplicas hacen falta.
+#
+#   python load_test.py --sessions 1 2 4 8 16 --duration 60 --think 1 --latency 30
+#
+# Las sesiones son AppTest (streamlit.testing.v1) en hilos: no incluyen el coste
+# del websocket ni del navegador, solo el de ejecutar el script.
+
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def _share_script_cache():
+    # AppTest compila app.py en cada ejecución con una caché propia; un servidor de
+    # Streamlit comparte una sola por proceso. Compartirla aquí evita medir esa
+    # compilación (y compilar a la vez desde varios hilos, que ast no soporta bien).
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    shared = ScriptCache()
+    local_script_runner.ScriptCache = lambda: shared
+
+
+def _share_runtime():
+    # AppTest instala un Runtime simulado al empezar cada ejecución y lo quita
+    # (Runtime._instance = None) al acabar, así que con varias sesiones a la vez una
+    # deja sin Runtime a las demás a mitad de rerun. Se le da a AppTest una subclase
+    # donde poner el suyo y el Runtime real queda fijo para todo el proceso.
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import app_test
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.dataframe_source_mgr = DataframeSourceManager()
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    app_test.Runtime = type("AppTestRuntime", (Runtime,), {})
+    Runtime._instance = shared
+
+
+def rss_mb():
+    """Current resident memory of this process in MB (peak RSS if /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(ordered, p):
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 1)
+
+
+class Session:
+    """One simulated user walking through the app."""
+
+    def __init__(self, user, food_names, think, rng):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.at.session_state.logged_in = True
+        self.at.session_state.token = user["token"]
+        self.at.session_state.username = user["username"]
+        self.at.session_state.full_name = user["full_name"]
+        self.at.session_state.page = "home"
+        self.food_names = food_names
+        self.think = think
+        self.rng = rng
+        self.latencies = []
+        self.errors = 0
+
+    def _run(self):
+        started = time.perf_counter()
+        self.at.run()
+        self.latencies.append(1000 * (time.perf_counter() - started))
+        if self.at.exception:
+            self.errors += 1
+
+    def _goto(self, page):
+        self.at.session_state.page = page
+        self._run()
+
+    def _button(self, key=None, label=None):
+        for button in self.at.button:
+            if (key is not None and button.key == key) or (label is not None and button.label == label):
+                return None if button.disabled else button
+        return None
+
+    def open_home(self):
+        self._goto("home")
+
+    def add_food(self):
+        if not self.at.session_state.add_food_expander:
+            button = self._button(key="add_food_btn")
+            if button is None:
+                return
+            button.click()
+            self._run()
+        name = self.rng.choice(self.food_names)
+        self.at.text_input(key="food_query").input(name[:4])
+        self._run()
+        button = self._button(key="add_button_float")
+        if button is not None:
+            button.click()
+            self._run()
+
+    def open_history(self):
+        self._goto("history")
+
+    def delete_log(self):
+        # La selección de filas de st.dataframe solo dura un rerun en AppTest
+        selection = {"selection": {"rows": [0], "columns": [], "cells": []}}
+        if not self.at.dataframe:
+            return
+        # La clave de la tabla lleva la versión de los datos (ver render_history_content)
+        key = f"history_table_{self.at.session_state.user_data['version']}"
+        self.at.session_state[key] = selection
+        self._run()
+        button = self._button(key="delete_selected_logs")
+        if button is not None:
+            self.at.session_state[key] = selection
+            button.click()
+            self._run()
+
+    def change_goal(self):
+        from translations import APP_STRINGS
+
+        self._goto("profile")
+        self.at.number_input(key="new_goal").set_value(self.rng.randint(20, 40))
+        button = self._button(label=APP_STRINGS[self.at.session_state.lang]['save_goal_button'])
+        if button is not None:
+            button.click()
+            self._run()
+
+    def walk(self, deadline):
+        steps = [self.open_home, self.add_food, self.open_history, self.delete_log, self.change_goal]
+        while time.monotonic() < deadline:
+            for step in steps:
+                if time.monotonic() >= deadline:
+                    return
+                try:
+                    step()
+                except Exception:
+                    self.errors += 1
+                time.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+
+
+def run_level(sessions, users, food_names, duration, think):
+    """Runs `sessions` concurrent users for `duration` seconds and returns the summary."""
+    from metrics import reset_metrics, snapshot
+
+    rng = random.Random(sessions)
+    walkers = [Session(users[i % len(users)], food_names, think, random.Random(rng.random()))
+               for i in range(sessions)]
+    reset_metrics()
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=walker.walk, args=(deadline,), name=f"session-{i}")
+               for i, walker in enumerate(walkers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    peak_rss = rss_mb()
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.5)
+        peak_rss = max(peak_rss, rss_mb())
+    elapsed_min = (time.monotonic() - started) / 60
+
+    latencies = sorted(ms for walker in walkers for ms in walker.latencies)
+    requests_sent = sum(summary["count"] for summary in snapshot()["endpoints"].values())
+    return {
+        "sessions": sessions,
+        "reruns": len(latencies),
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "max_ms": round(latencies[-1], 1) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies), 1) if latencies else None,
+        "requests_per_session_min": round(requests_sent / (sessions * elapsed_min), 1),
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss, 1),
+        "errors": sum(walker.errors for walker in walkers),
+    }
+
+
+def print_table(results):
+    header = (f"{'sesiones':>8} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8} "
+              f"{'req/ses·min':>12} {'RSS MB':>8} {'pico MB':>8} {'errores':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['sessions']:>8} {r['reruns']:>7} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['max_ms']:>8} {r['requests_per_session_min']:>12} {r['rss_mb']:>8} {r['peak_rss_mb']:>8} "
+              f"{r['errors']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de app.py con sesiones concurrentes.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="niveles de concurrencia")
+    parser.add_argument("--duration", type=float, default=30, help="segundos por nivel")
+    parser.add_argument("--think", type=float, default=1.0, help="pausa media entre pasos, en segundos")
+    parser.add_argument("--users", type=int, default=8, help="usuarios distintos (las sesiones se reparten)")
+    parser.add_argument("--logs", type=int, default=200, help="registros iniciales por usuario")
+    parser.add_argument("--latency", type=float, default=0.0, help="latencia simulada de la API, en ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variación de la latencia, en ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 503")
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NUTRIGOAL_DATA_DIR", tempfile.mkdtemp(prefix="nutrigoal-load-"))
+    os.environ.setdefault("NUTRIGOAL_METRICS_DUMP_INTERVAL", "0")
+    import api_client
+    import stub_api
+
+    _share_script_cache()
+    _share_runtime()
+    # Los hilos de las sesiones tocan session_state fuera de un rerun: aviso esperado
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    state = stub_api.StubState(latency=args.latency / 1000, jitter=args.jitter / 1000,
+                               error_rate=args.error_rate, seed=0)
+    users = []
+    for i in range(args.users):
+        username = f"load{i}"
+        state.seed(username, args.logs, full_name=f"Load {i}")
+        token = f"stub-token-{username}"
+        state.tokens[token] = username
+        users.append({"username": username, "token": token, "full_name": f"Load {i}"})
+    _, api_client.API_URL = stub_api.start_in_background(state)
+    food_names = [food['name'] for food in state.foods]
+
+    results = []
+    for sessions in args.sessions:
+        result = run_level(sessions, users, food_names, args.duration, args.think)
+        results.append(result)
+        print(f"{sessions} sesiones: {result['reruns']} reruns, p95 {result['p95_ms']} ms", file=sys.stderr)
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# log_store.py (Frontend - Registros de comida en formato compacto)
+#
+# Cada sesión guarda sus registros (los de la semana y las páginas de historial
+# cargadas) en st.session_state.user_data. Como lista de diccionarios JSON cada
+# registro ocupa varios cientos de bytes: el dict, la cadena de la fecha, el
+# nombre del alimento repetido en cada registro y los enteros. Con muchos usuarios
+# conectados al mismo proceso eso se acumula.
+#
+# LogStore guarda las mismas filas por columnas en arrays tipados:
+#
+#   - log_id y food_id como enteros de 64 y 32 bits;
+#   - la fecha como número de día (date.toordinal), 4 bytes;
+#   - el nombre no se guarda: sale del catálogo por food_id (el dict ``by_id``
+#     que comparten todas las sesiones, ver catalog.py).
+#
+# Lo que no cabe en esas columnas (registros pendientes de la cola, un nombre
+# distinto del del catálogo, ids que no son enteros, campos desconocidos...) va a
+# una lista de "extras" que solo existe mientras haya alguno.
+#
+# Para pintar, LogStore se comporta como una secuencia de solo lectura: len(),
+# índices e iteración devuelven un dict por fila, creado al vuelo, con las mismas
+# claves que la API (``date_consumed`` siempre como fecha ISO). Ver
+# memory_report.py para medir la diferencia.
+#
+# Si tiene un WeeklyRollups enganchado (attach_rollups, ver week_rollups.py), cada
+# fila que entra o sale lo actualiza.
+
+import copy
+from array import array
+from datetime import date
+
+from weekly_metrics import parse_log_date
+
+COLUMNS = ("log_id", "food_id", "food_name", "date_consumed")
+
+# Marca de "sin valor" en las columnas enteras
+_NO_LOG_ID = -2 ** 63
+_NO_INT = -2 ** 31
+
+
+def _fits(value, typecode):
+    # bool es un int, pero debe volver como bool
+    if type(value) is not int:
+        return False
+    if typecode == "q":
+        return _NO_LOG_ID < value < 2 ** 63
+    return _NO_INT < value < 2 ** 31
+
+
+class LogStore:
+    """Food logs of one session stored column-wise, newest first like the API returns them."""
+
+    # foods_by_id es el catálogo compartido: no cuenta en caches.estimate_size
+    _shared_attributes = ("foods_by_id",)
+
+    def __init__(self, logs=(), foods_by_id=None):
+        self.foods_by_id = foods_by_id if foods_by_id is not None else {}
+        self._log_ids = array("q")
+        self._food_ids = array("i")
+        self._days = array("i")
+        self._extras = None  # None, o una lista paralela con un dict (o None) por fila
+        self.rollups = None
+        self.extend(logs)
+
+    # --- Conversión entre filas y columnas ---
+
+    def _encode(self, log):
+        extra = {key: value for key, value in log.items() if key not in COLUMNS}
+        log_id, food_id = log.get('log_id'), log.get('food_id')
+        if not _fits(log_id, "q"):
+            extra['log_id'] = log_id
+            log_id = _NO_LOG_ID
+        if not _fits(food_id, "i"):
+            extra['food_id'] = food_id
+            food_id = _NO_INT
+        food = self.foods_by_id.get(food_id)
+        name = log.get('food_name')
+        if food is None or name != food.get('name'):
+            extra['food_name'] = name
+        day = parse_log_date(log.get('date_consumed'))
+        if day is None:
+            extra['date_consumed'] = log.get('date_consumed')
+            day = _NO_INT
+        else:
+            day = day.toordinal()
+        return log_id, food_id, day, extra or None
+
+    def _decode(self, index):
+        log_id, food_id, day = self._log_ids[index], self._food_ids[index], self._days[index]
+        log = {
+            "log_id": None if log_id == _NO_LOG_ID else log_id,
+            "food_id": None if food_id == _NO_INT else food_id,
+            "food_name": None,
+            "date_consumed": None if day == _NO_INT else date.fromordinal(day).isoformat(),
+        }
+        extra = self._extras[index] if self._extras is not None else None
+        if extra:
+            log.update(extra)
+        if extra is None or 'food_name' not in extra:
+            log['food_name'] = self.foods_by_id[food_id]['name']
+        return log
+
+    def _put(self, index, log):
+        log_id, food_id, day, extra = self._encode(log)
+        self._log_ids.insert(index, log_id)
+        self._food_ids.insert(index, food_id)
+        self._days.insert(index, day)
+        if extra is not None and self._extras is None:
+            self._extras = [None] * (len(self._log_ids) - 1)
+        if self._extras is not None:
+            self._extras.insert(index, extra)
+        if self.rollups is not None:
+            self._count(self.rollups.add, food_id, day, extra)
+
+    def _count(self, update, food_id, day, extra):
+        name = extra.get('food_name') if extra else None
+        update(None if food_id == _NO_INT else food_id, None if day == _NO_INT else day, name)
+
+    # --- Escritura ---
+
+    def insert(self, index, log):
+        """Inserts one log (a dict with the API's keys) before index, like list.insert."""
+        length = len(self)
+        index = max(0, min(length, index + length if index < 0 else index))
+        self._put(index, log)
+
+    def append(self, log):
+        self._put(len(self), log)
+
+    def extend(self, logs):
+        for log in logs:
+            self._put(len(self), log)
+
+    def remove_indices(self, indices):
+        """Removes the rows at the given positions."""
+        for index in sorted(set(indices), reverse=True):
+            if self.rollups is not None:
+                extra = self._extras[index] if self._extras is not None else None
+                self._count(self.rollups.remove, self._food_ids[index], self._days[index], extra)
+            del self._log_ids[index]
+            del self._food_ids[index]
+            del self._days[index]
+            if self._extras is not None:
+                del self._extras[index]
+        if self._extras is not None and not any(self._extras):
+            self._extras = None
+
+    def discard(self, log_id):
+        """Removes every row with this log_id."""
+        self.remove_indices(self.indices_of([log_id]))
+
+    def attach_rollups(self, rollups):
+        """Feeds the current rows to a WeeklyRollups and keeps it updated from now on."""
+        self.rollups = rollups
+        extras = self._extras or [None] * len(self)
+        for food_id, day, extra in zip(self._food_ids, self._days, extras):
+            self._count(rollups.add, food_id, day, extra)
+        return rollups
+
+    # --- Lectura ---
+
+    def indices_of(self, log_ids):
+        """Returns the positions of the rows whose log_id is in log_ids."""
+        found = []
+        for log_id in log_ids:
+            if _fits(log_id, "q"):
+                start = 0
+                while True:
+                    try:
+                        index = self._log_ids.index(log_id, start)
+                    except ValueError:
+                        break
+                    found.append(index)
+                    start = index + 1
+            elif self._extras is not None:
+                found.extend(i for i, extra in enumerate(self._extras)
+                             if extra and 'log_id' in extra and extra['log_id'] == log_id)
+        return sorted(found)
+
+    def log_id(self, index):
+        """The log_id of one row (None if unknown), without building the whole row."""
+        extra = self._extras[index] if self._extras is not None else None
+        if extra and 'log_id' in extra:
+            return extra['log_id']
+        log_id = self._log_ids[index]
+        return None if log_id == _NO_LOG_ID else log_id
+
+    def pending(self):
+        """Returns (position, log) for the rows waiting in the local write queue."""
+        if self._extras is None:
+            return []
+        return [(i, self._decode(i)) for i, extra in enumerate(self._extras) if extra and extra.get('pending')]
+
+    def __len__(self):
+        return len(self._log_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("log index out of range")
+        return self._decode(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._decode(index)
+
+    def __repr__(self):
+        return f"<LogStore {len(self)} logs>"
+
+    def __deepcopy__(self, memo):
+        # El catálogo es compartido: se copian las columnas, no el catálogo
+        clone = LogStore.__new__(LogStore)
+        clone.foods_by_id = self.foods_by_id
+        clone._log_ids = array("q", self._log_ids)
+        clone._food_ids = array("i", self._food_ids)
+        clone._days = array("i", self._days)
+        clone._extras = copy.deepcopy(self._extras, memo)
+        clone.rollups = copy.deepcopy(self.rollups, memo)
+        return clone
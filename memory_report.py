@@ -0,0 +1,99 @@
+# memory_report.py (Memoria por sesión de los registros de comida)
+#
+# Mide cuánto ocupan los registros de un usuario según cómo se guardan en la
+# sesión, con los mismos datos que devuelve la API local de stub_api.py:
+#
+#   - lista: la lista de dicts tal como sale de response.json() (lo que guardaban
+#     las sesiones antes de log_store.py);
+#   - LogStore: las mismas filas en columnas (log_store.py);
+#   - sesión: st.session_state.user_data completo tras cargar el panel y todas
+#     las páginas del historial (load_dashboard_data + load_history_page).
+#
+# Los tamaños son profundos (caches.estimate_size: sys.getsizeof de cada objeto
+# alcanzable, contado una vez) y no incluyen el catálogo, que comparten todas las
+# sesiones.
+#
+#   python memory_report.py --logs 100 1000 10000
+#   python memory_report.py --logs 5000 --json memory.json
+
+import argparse
+import json
+import os
+import tempfile
+
+DEFAULT_LOGS = [100, 1000, 5000]
+
+
+def measure_rows(state, username, foods):
+    """Sizes of one user's whole history as a list of dicts and as a LogStore."""
+    from caches import estimate_size
+    from log_store import LogStore
+
+    payload = json.dumps(state.user_logs(username))
+    rows = json.loads(payload)
+    foods_by_id = {food['id']: food for food in foods}
+    store = LogStore(json.loads(payload), foods_by_id)
+    list_bytes = estimate_size(rows, exclude=foods)
+    store_bytes = estimate_size(store, exclude=foods)
+    return {
+        "logs": len(rows),
+        "list_bytes": list_bytes,
+        "store_bytes": store_bytes,
+        "list_bytes_per_log": round(list_bytes / max(1, len(rows)), 1),
+        "store_bytes_per_log": round(store_bytes / max(1, len(rows)), 1),
+        "ratio": round(list_bytes / max(1, store_bytes), 1),
+    }
+
+
+def measure_session(token, lang="es"):
+    """Deep size of a session's user_data with every history page loaded."""
+    from caches import estimate_size
+    from catalog import get_catalog
+    from dashboard import load_dashboard_data, load_history_page
+
+    data = load_dashboard_data(token, lang)
+    while data["history"] is None or data["history"]["next_cursor"] is not None:
+        load_history_page(data, token)
+    foods = get_catalog(lang)
+    return estimate_size(data, exclude=[foods] + foods)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por sesión de los registros de comida.")
+    parser.add_argument("--logs", type=int, nargs="+", default=DEFAULT_LOGS, help="registros por usuario")
+    parser.add_argument("--json", help="guarda los resultados en este fichero")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NUTRIGOAL_DATA_DIR", tempfile.mkdtemp(prefix="nutrigoal-memory-"))
+    os.environ.setdefault("NUTRIGOAL_METRICS_DUMP_INTERVAL", "0")
+    import api_client
+    import stub_api
+
+    state = stub_api.StubState(seed=0)
+    _, api_client.API_URL = stub_api.start_in_background(state)
+
+    results = []
+    for count in args.logs:
+        username = f"memory{count}"
+        state.seed(username, count)
+        token = f"stub-token-{username}"
+        state.tokens[token] = username
+        result = measure_rows(state, username, state.foods)
+        result["session_bytes"] = measure_session(token)
+        results.append(result)
+
+    header = (f"{'registros':>9} {'lista B':>11} {'B/reg':>7} {'LogStore B':>11} {'B/reg':>7} "
+              f"{'x':>6} {'sesión B':>11}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['logs']:>9} {r['list_bytes']:>11} {r['list_bytes_per_log']:>7} {r['store_bytes']:>11} "
+              f"{r['store_bytes_per_log']:>7} {r['ratio']:>6} {r['session_bytes']:>11}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# metrics.py (Frontend - Métricas de rendimiento)
+#
+# Cada petición a la API (cada intento, ver api_client._send) y cada ejecución
+# de app.py (rerun completo, fragmento o callback, ver app.run_scope) se miden
+# aquí: número de llamadas, errores y latencia por endpoint o página. Las rutas
+# se agrupan sustituyendo los números por {id}, así que /api/user_food_logs/12 y
+# /api/user_food_logs/13 cuentan como el mismo endpoint.
+#
+# Para los percentiles (p50/p95/p99) se guardan las últimas
+# NUTRIGOAL_METRICS_WINDOW muestras de cada serie; además se acumula un
+# histograma por cubetas en formato Prometheus.
+#
+# También se exportan los contadores de las cachés acotadas (ver caches.py).
+#
+# Los datos se ven en la vista oculta de diagnóstico (app.py?diagnostics=<clave>,
+# solo si NUTRIGOAL_DIAGNOSTICS_KEY está definida) y
+# un hilo los vuelca cada NUTRIGOAL_METRICS_DUMP_INTERVAL segundos a
+# NUTRIGOAL_DATA_DIR/metrics-<pid>.json y .prom (un par por proceso).
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from caches import cache_stats
+from storage import write_atomic
+
+# Muestras recientes por serie para calcular percentiles
+METRICS_WINDOW = int(os.environ.get("NUTRIGOAL_METRICS_WINDOW", "1024"))
+
+# Segundos entre volcados a disco (0 desactiva el volcado)
+METRICS_DUMP_INTERVAL = float(os.environ.get("NUTRIGOAL_METRICS_DUMP_INTERVAL", "30"))
+
+# Límites superiores de las cubetas del histograma, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+_lock = threading.Lock()
+_series = {}  # (kind, name) -> Series
+_dumper = None
+
+
+class Series:
+    """Counts, errors and latencies of one endpoint or page."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.statuses = {}  # código HTTP (o "error") -> llamadas
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent = deque(maxlen=METRICS_WINDOW)
+
+    def add(self, seconds, status=None, error=False):
+        self.count += 1
+        self.errors += bool(error)
+        self.total += seconds
+        if status is not None:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.buckets[_bucket_index(seconds)] += 1
+        self.recent.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(1000 * self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": _percentile_ms(ordered, 50),
+            "p95_ms": _percentile_ms(ordered, 95),
+            "p99_ms": _percentile_ms(ordered, 99),
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+        }
+
+
+def _bucket_index(seconds):
+    for i, limit in enumerate(LATENCY_BUCKETS):
+        if seconds <= limit:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def _percentile_ms(ordered, p):
+    if not ordered:
+        return 0.0
+    rank = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return round(1000 * ordered[rank], 2)
+
+
+def endpoint_name(method, url):
+    """Returns the series name for a request, e.g. "DELETE /api/user_food_logs/{id}"."""
+    path = re.sub(r"^[a-z]+://[^/]+", "", url).split("?", 1)[0]
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def _record(kind, name, seconds, status=None, error=False):
+    with _lock:
+        series = _series.get((kind, name))
+        if series is None:
+            series = _series[(kind, name)] = Series()
+        series.add(seconds, status, error)
+
+
+def record_request(method, url, seconds, status=None):
+    """Records one API attempt; status None means it raised (timeout, connection...)."""
+    error = status is None or status >= 500
+    _record("endpoint", endpoint_name(method, url), seconds, "error" if status is None else status, error)
+
+
+def record_rerun(page, seconds, error=False):
+    """Records the wall time of one run of app.py (a full run, a fragment or a callback)."""
+    _record("rerun", page or "unknown", seconds, error=error)
+
+
+def snapshot():
+    """Returns {"endpoints": {...}, "reruns": {...}, "caches": {...}} with a summary per series."""
+    with _lock:
+        items = [(kind, name, series.summary()) for (kind, name), series in _series.items()]
+    result = {"pid": os.getpid(), "generated_at": time.time(), "endpoints": {}, "reruns": {},
+              "caches": cache_stats()}
+    for kind, name, summary in sorted(items):
+        result["endpoints" if kind == "endpoint" else "reruns"][name] = summary
+    return result
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text():
+    """Returns every series in the Prometheus text exposition format."""
+    with _lock:
+        items = sorted(
+            (kind, name, series.count, series.errors, series.total, list(series.buckets))
+            for (kind, name), series in _series.items()
+        )
+    lines = []
+    for kind, metric, label in (("endpoint", "nutrigoal_api_request", "endpoint"),
+                                ("rerun", "nutrigoal_rerun", "page")):
+        selected = [item for item in items if item[0] == kind]
+        # Cada familia de métricas va en un solo bloque, como exige el formato
+        lines.append(f"# TYPE {metric}_seconds histogram")
+        for _, name, count, _, total, buckets in selected:
+            value = _escape_label(name)
+            cumulative = 0
+            for limit, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket_count
+                lines.append(f'{metric}_seconds_bucket{{{label}="{value}",le="{limit}"}} {cumulative}')
+            lines.append(f'{metric}_seconds_sum{{{label}="{value}"}} {total:.6f}')
+            lines.append(f'{metric}_seconds_count{{{label}="{value}"}} {count}')
+        lines.append(f"# TYPE {metric}_errors_total counter")
+        for _, name, _, errors, _, _ in selected:
+            lines.append(f'{metric}_errors_total{{{label}="{_escape_label(name)}"}} {errors}')
+
+    caches = cache_stats()
+    lines.append("# TYPE nutrigoal_cache_budget_bytes gauge")
+    lines.append(f"nutrigoal_cache_budget_bytes {caches['budget_bytes']}")
+    for key, metric, kind in (("bytes", "nutrigoal_cache_bytes", "gauge"),
+                              ("entries", "nutrigoal_cache_entries", "gauge"),
+                              ("hits", "nutrigoal_cache_hits_total", "counter"),
+                              ("misses", "nutrigoal_cache_misses_total", "counter"),
+                              ("evictions", "nutrigoal_cache_evictions_total", "counter"),
+                              ("expirations", "nutrigoal_cache_expirations_total", "counter"),
+                              ("released", "nutrigoal_cache_released_total", "counter")):
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, stats in caches["caches"].items():
+            lines.append(f'{metric}{{cache="{_escape_label(name)}"}} {stats[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics():
+    """Writes metrics-<pid>.json and metrics-<pid>.prom to the data directory."""
+    base = f"metrics-{os.getpid()}"
+    write_atomic(base + ".json", json.dumps(snapshot(), indent=2, ensure_ascii=False).encode("utf-8"))
+    write_atomic(base + ".prom", prometheus_text().encode("utf-8"))
+
+
+def _dump_forever():
+    while True:
+        time.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            dump_metrics()
+        except OSError:
+            logger.warning("Could not dump the metrics", exc_info=True)
+
+
+def start_dumper():
+    """Starts this process's periodic metrics dump if it is enabled and not running yet."""
+    global _dumper
+    if _dumper is None and METRICS_DUMP_INTERVAL > 0:
+        with _lock:
+            if _dumper is None:
+                _dumper = threading.Thread(target=_dump_forever, name="metrics-dump", daemon=True)
+                _dumper.start()
+
+
+def reset_metrics():
+    """Forgets every recorded series."""
+    with _lock:
+        _series.clear()
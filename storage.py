@@ -0,0 +1,39 @@
+# storage.py (Frontend - Carpeta de datos locales)
+#
+# Todo lo que la app guarda en disco (instantáneas del catálogo, cola de
+# escrituras, volcados de métricas...) va a NUTRIGOAL_DATA_DIR, compartida por
+# todos los procesos de Streamlit de la máquina. Los ficheros se reemplazan de
+# forma atómica: se escriben en un temporal de la misma carpeta y se renombran
+# con os.replace, así que ningún proceso lee nunca un fichero a medias. La
+# carpeta se crea con permisos 0700: solo el usuario de los procesos la lee.
+
+import os
+import tempfile
+
+DATA_DIR = os.environ.get("NUTRIGOAL_DATA_DIR", os.path.join(tempfile.gettempdir(), "nutrigoal"))
+
+
+def data_path(name):
+    """Returns the path of name inside the data directory, creating the directory if needed."""
+    os.makedirs(DATA_DIR, mode=0o700, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def write_atomic(name, data, durable=False):
+    """Replaces the data-directory file name with data (bytes) in one step.
+
+    With durable=True the contents are flushed to disk before the rename.
+    """
+    path = data_path(name)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}-", dir=DATA_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
@@ -0,0 +1,410 @@
+# stub_api.py (Servidor local que imita la API de NutriGoal)
+#
+# Sirve para probar app.py sin depender de https://nutrigoal-api.onrender.com.
+# Guarda todo en memoria y acepta cualquier token que haya devuelto /api/login.
+# Implementa todos los endpoints que usa app.py; las métricas semanales se
+# calculan con weekly_metrics.py, igual que en el cliente.
+#
+#   python stub_api.py --port 5055 --logs 3000
+#   NUTRIGOAL_API_URL=http://127.0.0.1:5055 streamlit run app.py
+#
+# Para simular una API lenta o inestable, cada petición puede esperar
+# ``--latency`` ms (± ``--jitter``) y fallar con 503 con probabilidad
+# ``--error-rate``. ``--no-categories`` sirve un catálogo sin categorías, lo que
+# obliga a la app a pedir las métricas a los endpoints en vez de calcularlas, y
+# ``--no-pagination`` ignora ``limit``, ``cursor`` y ``since`` como la API real.
+#
+# Contrato de paginación de /api/user_food_logs:
+#   - sin ``limit`` devuelve una lista con todos los registros (como la API real);
+#   - con ``limit`` (y opcionalmente ``cursor``) devuelve
+#     {"items": [...], "next_cursor": "<cursor>" | null}, del más reciente al más
+#     antiguo. El cursor es opaco para el cliente.
+#   - ``since=YYYY-MM-DD`` filtra los registros anteriores a esa fecha.
+#
+# POST /api/user_food_logs acepta ``date_consumed`` y la cabecera
+# Idempotency-Key: una clave repetida devuelve la respuesta original sin crear
+# otro registro. POST /api/user_food_logs/batch recibe
+# {"items": [{"food_id", "date_consumed"?, "idempotency_key"?}, ...]} y contesta
+# 200 con {"results": [{"status": 201 | 4xx, ...registro o "error"}, ...]} en el
+# mismo orden.
+#
+# Las respuestas GET con 200 llevan ETag (hash del cuerpo) y /api/foods además
+# Last-Modified; si la petición trae If-None-Match / If-Modified-Since y nada ha
+# cambiado se contesta 304 sin cuerpo. Los cuerpos se comprimen con gzip cuando
+# el cliente lo acepta. ``StubState.stats`` cuenta respuestas, 304 y bytes.
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from weekly_metrics import compute_weekly_metrics, is_plant
+
+# Por debajo de este tamaño no compensa comprimir
+GZIP_MIN_BYTES = 512
+
+DEFAULT_FOODS = [
+    ("Ajo", "vegetable", True, False),
+    ("Cebolla", "vegetable", True, False),
+    ("Espárrago", "vegetable", True, False),
+    ("Brócoli", "vegetable", False, False),
+    ("Espinaca", "vegetable", False, False),
+    ("Zanahoria", "vegetable", False, False),
+    ("Plátano", "fruit", True, False),
+    ("Manzana", "fruit", False, False),
+    ("Lenteja", "legume", True, False),
+    ("Garbanzo", "legume", True, False),
+    ("Avena", "grain", True, False),
+    ("Quinoa", "grain", False, False),
+    ("Almendra", "nut", False, False),
+    ("Chía", "seed", False, False),
+    ("Cúrcuma", "spice", False, False),
+    ("Perejil", "herb", False, False),
+    ("Yogur", "fermented", False, True),
+    ("Kéfir", "fermented", False, True),
+    ("Chucrut", "fermented", False, True),
+    ("Kimchi", "fermented", False, True),
+]
+
+
+class StubState:
+    """In-memory users, foods and food logs shared by every request."""
+
+    def __init__(self, foods=None, latency=0.0, jitter=0.0, error_rate=0.0, categories=True, pagination=True,
+                 seed=None):
+        self.lock = threading.Lock()
+        self.latency = latency  # segundos de espera por petición
+        self.jitter = jitter
+        self.error_rate = error_rate  # probabilidad de contestar 503
+        self.categories = categories
+        self.pagination = pagination  # False: /api/user_food_logs siempre devuelve la lista completa
+        self.random = random.Random(seed)
+        self.foods = foods or [
+            {"id": i, "name": name, "category": category, "is_prebiotic": pre, "is_probiotic": pro}
+            for i, (name, category, pre, pro) in enumerate(DEFAULT_FOODS, start=1)
+        ]
+        self.users = {}  # username -> {"password", "full_name", "goal"}
+        self.tokens = {}  # token -> username
+        self.logs = {}  # username -> [log, ...]
+        self.next_log_id = 1
+        self.foods_modified = formatdate(time.time(), usegmt=True)
+        self.stats = {"responses": 0, "not_modified": 0, "bytes_sent": 0}
+        self.idempotent = {}  # Idempotency-Key -> (status, body) de la primera respuesta
+
+    def add_log(self, username, food_id, day=None):
+        food = next((f for f in self.foods if f['id'] == food_id), None)
+        if food is None:
+            return None
+        with self.lock:
+            log = {
+                "log_id": self.next_log_id,
+                "food_id": food_id,
+                "food_name": food['name'],
+                "date_consumed": (day or date.today()).isoformat(),
+            }
+            self.next_log_id += 1
+            self.logs.setdefault(username, []).append(log)
+        return log
+
+    def create_log(self, username, body, key=None):
+        """Handles one log creation (single or batch item); returns (status, body).
+
+        A repeated idempotency key returns the first answer without adding a log.
+        """
+        with self.lock:
+            replay = self.idempotent.get((username, key)) if key else None
+        if replay is not None:
+            return replay
+        try:
+            day = date.fromisoformat(body["date_consumed"]) if body.get("date_consumed") else None
+        except (TypeError, ValueError):
+            return 400, {"error": "Fecha no válida"}
+        log = self.add_log(username, body.get("food_id"), day)
+        if log is None:
+            return 404, {"error": "Alimento no encontrado"}
+        answer = (201, {"message": "Alimento añadido", **log})
+        if key:
+            with self.lock:
+                self.idempotent[(username, key)] = answer
+        return answer
+
+    def seed(self, username, count, password="stub", full_name="Stub User"):
+        """Creates a user with ``count`` logs spread over the previous days."""
+        self.users.setdefault(username, {"password": password, "full_name": full_name, "goal": 30})
+        for i in range(count):
+            food = self.foods[i % len(self.foods)]
+            self.add_log(username, food['id'], date.today() - timedelta(days=i // 5))
+
+    def public_foods(self):
+        """The catalog as /api/foods serves it (without categories if disabled)."""
+        if self.categories:
+            return self.foods
+        return [{"id": f['id'], "name": f['name']} for f in self.foods]
+
+    def weekly(self, username):
+        """This week's metrics for the user, computed like the client does."""
+        return compute_weekly_metrics(self.user_logs(username), self.foods)
+
+    def suggestions(self, username, limit=5):
+        """Plants the user has not eaten this week."""
+        eaten = set(self.weekly(username)["vegetables"])
+        return [{"id": f['id'], "name": f['name']} for f in self.foods
+                if is_plant(f) and f['name'] not in eaten][:limit]
+
+    def user_logs(self, username):
+        """Returns the user's logs from the most recent to the oldest."""
+        with self.lock:
+            logs = list(self.logs.get(username, []))
+        return sorted(logs, key=lambda log: (log['date_consumed'], log['log_id']), reverse=True)
+
+
+def paginate(logs, limit, cursor=None):
+    """Returns (page, next_cursor) for logs already sorted from newest to oldest.
+
+    The cursor is just the offset of the next log, which is enough for a stand-in.
+    """
+    start = int(cursor) if cursor else 0
+    page = logs[start:start + limit]
+    next_start = start + len(page)
+    return page, (str(next_start) if next_start < len(logs) else None)
+
+
+# Endpoints de métricas semanales: ruta -> respuesta a partir de compute_weekly_metrics
+WEEKLY_ENDPOINTS = {
+    "/api/user_progress": lambda weekly: {"vegetable_count": weekly["vegetable_count"]},
+    "/api/diversity_metrics": lambda weekly: weekly["diversity"],
+    "/api/user_vegetables": lambda weekly: weekly["vegetables"],
+    "/api/user_prebiotics": lambda weekly: weekly["prebiotics"],
+    "/api/user_probiotics": lambda weekly: weekly["probiotics"],
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None  # StubState, set by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _inject_faults(self):
+        """Waits the configured latency; returns True if this request must fail with 503."""
+        state = self.state
+        with state.lock:
+            delay = max(0.0, state.latency + state.random.uniform(-state.jitter, state.jitter))
+            fail = state.random.random() < state.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._send_json(503, {"error": "Error simulado"})
+        return fail
+
+    def do_GET(self):
+        if not self._inject_faults():
+            self._get()
+
+    def do_POST(self):
+        if not self._inject_faults():
+            self._post()
+
+    def do_PUT(self):
+        if not self._inject_faults():
+            self._put()
+
+    def do_DELETE(self):
+        if not self._inject_faults():
+            self._delete()
+
+    def _count(self, sent_bytes, not_modified=False):
+        with self.state.lock:
+            self.state.stats["responses"] += 1
+            self.state.stats["bytes_sent"] += sent_bytes
+            if not_modified:
+                self.state.stats["not_modified"] += 1
+
+    def _not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if last_modified and if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _send_json(self, status, body, last_modified=None):
+        payload = json.dumps(body).encode("utf-8")
+        etag = None
+        if self.command == "GET" and status == 200:
+            etag = '"%s"' % hashlib.sha1(payload).hexdigest()[:16]
+            if self._not_modified(etag, last_modified):
+                # Se cuenta antes de contestar: quien lea stats tras la respuesta ya la ve
+                self._count(0, not_modified=True)
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+        gzipped = len(payload) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            payload = gzip.compress(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Vary", "Accept-Encoding")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        if etag:
+            self.send_header("ETag", etag)
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        self._count(len(payload))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _username(self):
+        username = self.state.tokens.get(self.headers.get("x-access-tokens"))
+        if username is None:
+            self._send_json(401, {"error": "Token inválido"})
+        return username
+
+    def _get(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/api/foods":
+            return self._send_json(200, self.state.public_foods(), last_modified=self.state.foods_modified)
+        username = self._username()
+        if username is None:
+            return
+        if url.path == "/api/user_food_logs":
+            logs = self.state.user_logs(username)
+            if not self.state.pagination:
+                return self._send_json(200, logs)
+            if query.get("since"):
+                logs = [log for log in logs if log['date_consumed'] >= query["since"]]
+            if "limit" not in query:
+                return self._send_json(200, logs)
+            page, next_cursor = paginate(logs, int(query["limit"]), query.get("cursor"))
+            return self._send_json(200, {"items": page, "next_cursor": next_cursor})
+        if url.path == "/api/user/goal":
+            return self._send_json(200, {"weekly_vegetable_goal": self.state.users[username]["goal"]})
+        if url.path == "/api/suggested_foods":
+            return self._send_json(200, self.state.suggestions(username))
+        if url.path in WEEKLY_ENDPOINTS:
+            return self._send_json(200, WEEKLY_ENDPOINTS[url.path](self.state.weekly(username)))
+        self._send_json(404, {"error": "No encontrado"})
+
+    def _post(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if url.path == "/api/register":
+            if body.get("username") in self.state.users:
+                return self._send_json(409, {"error": "El usuario ya existe"})
+            self.state.users[body.get("username")] = {
+                "password": body.get("password"), "full_name": body.get("full_name", ""), "goal": 30,
+            }
+            return self._send_json(201, {"message": "Usuario registrado"})
+        if url.path == "/api/login":
+            user = self.state.users.get(body.get("username"))
+            if user is None or user["password"] != body.get("password"):
+                return self._send_json(401, {"error": "Credenciales incorrectas"})
+            token = f"stub-token-{body['username']}"
+            self.state.tokens[token] = body["username"]
+            return self._send_json(200, {"token": token, "full_name": user["full_name"]})
+        username = self._username()
+        if username is None:
+            return
+        if url.path == "/api/user_food_logs":
+            return self._send_json(*self.state.create_log(username, body, self.headers.get("Idempotency-Key")))
+        if url.path == "/api/user_food_logs/batch":
+            items = body.get("items")
+            if not isinstance(items, list) or not items:
+                return self._send_json(400, {"error": "Se esperaba una lista 'items'"})
+            results = []
+            for item in items:
+                item = item if isinstance(item, dict) else {}
+                status, answer = self.state.create_log(username, item, item.get("idempotency_key"))
+                results.append({"status": status, **answer})
+            return self._send_json(200, {"results": results})
+        self._send_json(404, {"error": "No encontrado"})
+
+    def _put(self):
+        username = self._username()
+        if username is None:
+            return
+        if urlparse(self.path).path == "/api/user/goal":
+            self.state.users[username]["goal"] = int(self._read_json().get("goal", 30))
+            return self._send_json(200, {"message": "Objetivo actualizado"})
+        self._send_json(404, {"error": "No encontrado"})
+
+    def _delete(self):
+        username = self._username()
+        if username is None:
+            return
+        path = urlparse(self.path).path
+        if path.startswith("/api/user_food_logs/"):
+            log_id = int(path.rsplit("/", 1)[1])
+            with self.state.lock:
+                logs = self.state.logs.get(username, [])
+                remaining = [log for log in logs if log['log_id'] != log_id]
+                self.state.logs[username] = remaining
+            if len(remaining) == len(logs):
+                return self._send_json(404, {"error": "Registro no encontrado"})
+            return self._send_json(200, {"message": "Registro eliminado"})
+        self._send_json(404, {"error": "No encontrado"})
+
+
+def make_server(host="127.0.0.1", port=0, state=None):
+    """Creates (but does not start) a threaded stub server; port 0 picks a free port."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state or StubState()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_background(state=None):
+    """Starts a stub server on a free port in a daemon thread and returns (server, url)."""
+    server = make_server(state=state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de NutriGoal.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--user", default="demo", help="usuario creado al arrancar (contraseña: stub)")
+    parser.add_argument("--logs", type=int, default=0, help="registros de ejemplo para ese usuario")
+    parser.add_argument("--latency", type=float, default=0.0, help="espera por petición, en ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variación aleatoria de la espera, en ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de peticiones que fallan con 503")
+    parser.add_argument("--no-categories", action="store_true", help="sirve el catálogo sin categorías")
+    parser.add_argument("--no-pagination", action="store_true",
+                        help="ignora limit, cursor y since en /api/user_food_logs")
+    parser.add_argument("--seed", type=int, help="semilla para la latencia y los errores simulados")
+    args = parser.parse_args()
+
+    state = StubState(latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+                      categories=not args.no_categories, pagination=not args.no_pagination, seed=args.seed)
+    state.seed(args.user, args.logs)
+    server = make_server(args.host, args.port, state)
+    print(f"API local en http://{args.host}:{args.port} (usuario '{args.user}', contraseña 'stub')")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
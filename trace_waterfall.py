@@ -0,0 +1,114 @@
+# trace_waterfall.py (Reconstruye la cascada de peticiones de un rerun)
+#
+# Lee el log de spans que escribe tracing.py y dibuja en texto la cascada de
+# peticiones de una traza: cuándo empezó cada una respecto al inicio del rerun,
+# cuánto duró, su estado y sus bytes.
+#
+#   python trace_waterfall.py                 # la última traza registrada
+#   python trace_waterfall.py <trace_id>      # una traza concreta (vale un prefijo)
+#   python trace_waterfall.py --list 20       # las últimas 20 trazas
+#   python trace_waterfall.py --page home     # la última traza de esa página
+
+import argparse
+import json
+import os
+import sys
+
+from storage import DATA_DIR
+from tracing import SPANS_FILE
+
+BAR_WIDTH = 50
+
+
+def read_spans(paths):
+    """Returns every span in the given JSONL files, skipping unreadable lines."""
+    spans = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return spans
+
+
+def group_traces(spans):
+    """Groups spans by trace id; returns {trace_id: {"root": span | None, "children": [...]}}."""
+    traces = {}
+    for span in spans:
+        entry = traces.setdefault(span["trace_id"], {"root": None, "children": []})
+        if span.get("parent_id") is None:
+            entry["root"] = span
+        else:
+            entry["children"].append(span)
+    return traces
+
+
+def _trace_start(entry):
+    starts = [span["start"] for span in entry["children"]]
+    if entry["root"] is not None:
+        starts.append(entry["root"]["start"])
+    return min(starts) if starts else 0.0
+
+
+def render_waterfall(trace_id, entry):
+    """Returns the text waterfall of one trace."""
+    root = entry["root"] or {}
+    origin = _trace_start(entry)
+    children = sorted(entry["children"], key=lambda span: span["start"])
+    ends = [span["start"] - origin + span["duration_ms"] / 1000 for span in children]
+    if root:
+        ends.append(root["start"] - origin + root["duration_ms"] / 1000)
+    total = max(ends, default=0.0) or 1e-9
+
+    lines = [f"trace {trace_id}  page={root.get('page', '?')}  user={root.get('user', '?')}  "
+             f"total={1000 * total:.1f} ms  requests={len(children)}"]
+    name_width = max([len(span["name"]) for span in children] + [10])
+    for span in children:
+        offset = span["start"] - origin
+        duration = span["duration_ms"] / 1000
+        left = int(round(BAR_WIDTH * offset / total))
+        width = max(1, int(round(BAR_WIDTH * duration / total)))
+        bar = " " * left + "█" * min(width, BAR_WIDTH - left)
+        lines.append(f"{span['name']:<{name_width}} |{bar:<{BAR_WIDTH}}| +{1000 * offset:7.1f} ms "
+                     f"{span['duration_ms']:8.1f} ms  {span['status']}  {span.get('bytes') or 0} B  "
+                     f"[{span.get('thread', '')}]")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascada de peticiones de una traza de NutriGoal.")
+    parser.add_argument("trace_id", nargs="?", help="id (o prefijo) de la traza; por defecto la última")
+    parser.add_argument("--page", help="última traza de esta página")
+    parser.add_argument("--list", type=int, metavar="N", help="lista las últimas N trazas")
+    parser.add_argument("--file", action="append", help="fichero de spans (por defecto los de NUTRIGOAL_DATA_DIR)")
+    args = parser.parse_args()
+
+    default_path = os.path.join(DATA_DIR, SPANS_FILE)
+    traces = group_traces(read_spans(args.file or [default_path + ".1", default_path]))
+    if not traces:
+        sys.exit("No hay spans registrados.")
+    ordered = sorted(traces.items(), key=lambda item: _trace_start(item[1]))
+
+    if args.list:
+        for trace_id, entry in ordered[-args.list:]:
+            root = entry["root"] or {}
+            print(f"{trace_id}  page={root.get('page', '?'):<12} {root.get('duration_ms', 0):8.1f} ms  "
+                  f"{len(entry['children'])} peticiones")
+        return
+
+    if args.trace_id:
+        ordered = [item for item in ordered if item[0].startswith(args.trace_id)]
+    if args.page:
+        ordered = [item for item in ordered if (item[1]["root"] or {}).get("page") == args.page]
+    if not ordered:
+        sys.exit("No se ha encontrado la traza.")
+    print(render_waterfall(*ordered[-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# tracing.py (Frontend - Trazas de cada rerun)
+#
+# Cada ejecución de app.py abre una traza con un identificador propio. Todas las
+# peticiones a la API hechas durante esa ejecución (también desde los hilos del
+# pool, que copian el contexto) llevan la cabecera W3C ``traceparent`` con ese
+# identificador, así que el backend puede asociar sus logs al rerun del usuario.
+# Los callbacks de los widgets y los reruns de un fragmento, que no pasan por el
+# bloque principal del script, abren su propia traza (ver app.run_scope); las
+# recargas en segundo plano van en la traza del rerun que las lanzó, y cada ronda
+# de la cola de escrituras (write_queue.py) que envía algo es otra traza.
+#
+# Cada petición es un "span" (endpoint, inicio, duración, estado, bytes) hijo del
+# span raíz del rerun. Al terminar la traza se añaden todos, una línea JSON por
+# span, a NUTRIGOAL_DATA_DIR/spans.jsonl (rotado a spans.jsonl.1 al pasar de
+# NUTRIGOAL_TRACE_MAX_BYTES). Con trace_waterfall.py se reconstruye offline la
+# cascada de peticiones de cualquier carga de página.
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+from storage import data_path
+
+# Fracción de reruns cuyos spans se escriben (la cabecera se envía siempre)
+TRACE_SAMPLE = float(os.environ.get("NUTRIGOAL_TRACE_SAMPLE", "1"))
+
+# Tamaño a partir del cual se rota el fichero de spans
+TRACE_MAX_BYTES = int(os.environ.get("NUTRIGOAL_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+SPANS_FILE = "spans.jsonl"
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar("nutrigoal_trace", default=None)
+_write_lock = threading.Lock()
+
+
+def _new_span_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """Spans of one script run, written together when the run ends."""
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex
+        self.root_id = _new_span_id()
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.sampled = random.random() < TRACE_SAMPLE
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self._spans = []
+        self._closed = False
+
+    def traceparent(self, span_id):
+        """Returns the W3C traceparent header value for a child span."""
+        return f"00-{self.trace_id}-{span_id}-{'01' if self.sampled else '00'}"
+
+    def add_span(self, span):
+        if not self.sampled:
+            return
+        span = {"trace_id": self.trace_id, "parent_id": self.root_id, **span}
+        with self._lock:
+            late = self._closed
+            if not late:
+                self._spans.append(span)
+        if late:
+            # Un hilo que termina después del rerun: su span se escribe suelto
+            _append_spans([span])
+
+    def close(self, **attributes):
+        self.attributes.update(attributes)
+        end = time.time()
+        root = {
+            "trace_id": self.trace_id, "span_id": self.root_id, "parent_id": None, "name": self.name,
+            "start": self.start, "duration_ms": round(1000 * (end - self.start), 3), **self.attributes,
+        }
+        with self._lock:
+            self._closed = True
+            spans, self._spans = self._spans, []
+        if self.sampled:
+            _append_spans([root] + spans)
+
+
+def _append_spans(spans):
+    lines = "".join(json.dumps(span, ensure_ascii=False) + "\n" for span in spans)
+    try:
+        with _write_lock:
+            path = data_path(SPANS_FILE)
+            try:
+                if os.path.getsize(path) > TRACE_MAX_BYTES:
+                    os.replace(path, path + ".1")
+            except OSError:
+                pass
+            # Una sola escritura en modo append: las líneas de varios procesos no se mezclan
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(lines)
+    except OSError:
+        logger.warning("Could not write the span log", exc_info=True)
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Opens a trace for the block; extra attributes are stored on the root span.
+
+    The trace lives in a context variable, like api_client.request_scope, so
+    work submitted with ``contextvars.copy_context().run`` belongs to it too.
+    """
+    current = Trace(name, attributes)
+    reset_token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(reset_token)
+        current.close()
+
+
+def current_trace():
+    """Returns the active Trace, or None outside of a traced run."""
+    return _current_trace.get()
+
+
+def start_span(headers):
+    """Adds the traceparent header for a new request span; returns (trace, span_id) or (None, None)."""
+    current = _current_trace.get()
+    if current is None:
+        return None, None
+    span_id = _new_span_id()
+    headers["traceparent"] = current.traceparent(span_id)
+    return current, span_id
+
+
+def end_span(current, span_id, name, start, duration, status=None, size=None):
+    """Records a finished request span; status None means the request raised."""
+    if current is None:
+        return
+    current.add_span({
+        "span_id": span_id, "name": name, "start": start, "duration_ms": round(1000 * duration, 3),
+        "status": status if status is not None else "error", "bytes": size,
+        "thread": threading.current_thread().name,
+    })
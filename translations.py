@@ -11,6 +11,11 @@ APP_STRINGS = {
         'vegetable_metric': 'Vegetales únicos esta semana',
         'add_food_title': 'Añadir Alimento',
         'select_food': 'Selecciona un alimento',
+        'search_food': 'Busca un alimento',
+        'no_food_matches': 'Ningún alimento coincide con la búsqueda',
+        'meal_mode': 'Registrar una comida',
+        'select_foods': 'Selecciona los alimentos',
+        'log_meal_button': 'Registrar comida',
         'add_button': 'Añadir',
         'success_add_food': '¡Alimento añadido con éxito!',
         'error_add_food': 'Error al añadir el alimento.',
@@ -80,6 +85,11 @@ APP_STRINGS = {
         'vegetable_metric': 'Unique vegetables this week',
         'add_food_title': 'Add Food',
         'select_food': 'Select a food',
+        'search_food': 'Search for a food',
+        'no_food_matches': 'No food matches your search',
+        'meal_mode': 'Log a meal',
+        'select_foods': 'Select the foods',
+        'log_meal_button': 'Log meal',
         'add_button': 'Add',
         'success_add_food': 'Food added successfully!',
         'error_add_food': 'Error adding food.',
@@ -149,6 +159,11 @@ APP_STRINGS = {
         'vegetable_metric': 'Légumes uniques cette semaine',
         'add_food_title': 'Ajouter un aliment',
         'select_food': 'Sélectionnez un aliment',
+        'search_food': 'Recherchez un aliment',
+        'no_food_matches': 'Aucun aliment ne correspond à la recherche',
+        'meal_mode': 'Enregistrer un repas',
+        'select_foods': 'Sélectionnez les aliments',
+        'log_meal_button': 'Enregistrer le repas',
         'add_button': 'Ajouter',
         'success_add_food': 'Aliment ajouté avec succès !',
         'error_add_food': 'Erreur lors de l\'ajout de l\'aliment.',
@@ -218,6 +233,11 @@ APP_STRINGS = {
         'vegetable_metric': 'Einzigartige Gemüse diese Woche',
         'add_food_title': 'Essen hinzufügen',
         'select_food': 'Wählen Sie ein Essen aus',
+        'search_food': 'Suchen Sie ein Lebensmittel',
+        'no_food_matches': 'Kein Lebensmittel entspricht der Suche',
+        'meal_mode': 'Eine Mahlzeit eintragen',
+        'select_foods': 'Wählen Sie die Lebensmittel aus',
+        'log_meal_button': 'Mahlzeit eintragen',
         'add_button': 'Hinzufügen',
         'success_add_food': 'Essen erfolgreich hinzugefügt!',
         'error_add_food': 'Fehler beim Hinzufügen von Essen.',
@@ -287,6 +307,11 @@ APP_STRINGS = {
         'vegetable_metric': 'Verdure uniche questa settimana',
         'add_food_title': 'Aggiungi cibo',
         'select_food': 'Seleziona un cibo',
+        'search_food': 'Cerca un alimento',
+        'no_food_matches': 'Nessun alimento corrisponde alla ricerca',
+        'meal_mode': 'Registra un pasto',
+        'select_foods': 'Seleziona gli alimenti',
+        'log_meal_button': 'Registra il pasto',
         'add_button': 'Aggiungi',
         'success_add_food': 'Cibo aggiunto con successo!',
         'error_add_food': 'Errore nell\'aggiungere il cibo.',
@@ -0,0 +1,242 @@
+# week_rollups.py (Frontend - Resúmenes semanales incrementales)
+#
+# Las métricas de la página de inicio se recalculaban desde cero recorriendo todos
+# los registros de la semana en cada alta o baja (weekly_metrics.compute_weekly_metrics).
+# WeeklyRollups mantiene, por semana, un resumen que se actualiza en O(1) con
+# cada registro que entra o sale:
+#
+#   - ``bits``: un entero de Python usado como bitset, con un bit encendido por
+#     cada alimento del catálogo comido esa semana;
+#   - cuántos registros hay de cada alimento (para saber cuándo apagar su bit);
+#   - cuántos alimentos distintos hay de cada categoría, y cuántas plantas,
+#     prebióticos y probióticos.
+#
+# Con eso "vegetales únicos esta semana" es un contador, y comparar con otras
+# semanas o sacar los alimentos que aún no se han comido son operaciones de bits
+# (&, |, ~) sobre esos enteros.
+#
+# Las semanas se identifican por el número de día (date.toordinal) de su primer
+# día, según NUTRIGOAL_WEEK_START (0 = lunes: semanas ISO). Un LogStore con un
+# WeeklyRollups enganchado (LogStore.attach_rollups) lo mantiene al día solo.
+#
+# Los bits no son los food_id (que pueden ser grandes o tener huecos y harían
+# enteros enormes) sino posiciones densas 0..N-1 en el catálogo. CatalogIndex
+# las asigna una vez por catálogo, junto con las máscaras de todos los
+# alimentos, plantas, prebióticos y probióticos; lo comparten todos los
+# WeeklyRollups del mismo dict ``by_id`` (ver catalog.py) y va en una
+# BoundedCache (ver caches.py).
+
+import copy
+from datetime import date
+
+from caches import BoundedCache, estimate_size
+from weekly_metrics import WEEK_START, is_plant
+
+_indexes = BoundedCache("rollup_index", max_entries=8)  # id(foods_by_id) -> CatalogIndex
+
+
+def _ordinal(day):
+    return day.toordinal() if isinstance(day, date) else day
+
+
+def is_prebiotic(food):
+    return bool(food.get('is_prebiotic'))
+
+
+def is_probiotic(food):
+    return bool(food.get('is_probiotic'))
+
+
+def bit_ids(bits):
+    """Yields the positions of the set bits, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class CatalogIndex:
+    """Dense bit positions for the foods of one catalog, and the masks of its groups."""
+
+    # El catálogo es compartido: no cuenta en caches.estimate_size
+    _shared_attributes = ("foods_by_id", "foods")
+
+    def __init__(self, foods_by_id):
+        self.foods_by_id = foods_by_id
+        self.foods = list(foods_by_id.values())  # posición -> alimento
+        self.positions = {food_id: position for position, food_id in enumerate(foods_by_id)}
+        self.ids_by_name = {food['name']: food_id for food_id, food in foods_by_id.items()}
+        self._masks = {None: (1 << len(self.foods)) - 1}
+        for predicate in (is_plant, is_prebiotic, is_probiotic):
+            self._masks[predicate] = self._build_mask(predicate)
+
+    def _build_mask(self, predicate):
+        bits = 0
+        for position, food in enumerate(self.foods):
+            if predicate(food):
+                bits |= 1 << position
+        return bits
+
+    def mask(self, predicate=None):
+        """Bitset of the foods matching predicate (all of them if None)."""
+        bits = self._masks.get(predicate)
+        return self._build_mask(predicate) if bits is None else bits
+
+
+def catalog_index(foods_by_id):
+    """The CatalogIndex of a foods_by_id dict, built once and shared while it is cached."""
+    index = _indexes.get(id(foods_by_id))
+    # El id de un dict ya liberado puede reutilizarse para otro
+    if index is None or index.foods_by_id is not foods_by_id:
+        index = CatalogIndex(foods_by_id)
+        _indexes.set(id(foods_by_id), index, size=estimate_size(index))
+    return index
+
+
+class WeekRollup:
+    """Foods eaten during one week: bitset, logs per food and distinct foods per group."""
+
+    def __init__(self):
+        self.bits = 0
+        self.logs_per_food = {}  # posición -> registros de la semana
+        self.categories = {}  # categoría -> alimentos distintos
+        self.plants = 0
+        self.prebiotics = 0
+        self.probiotics = 0
+
+    def _count(self, food, step):
+        category = str(food.get('category', '')).lower()
+        self.categories[category] = self.categories.get(category, 0) + step
+        if not self.categories[category]:
+            del self.categories[category]
+        self.plants += step if is_plant(food) else 0
+        self.prebiotics += step if food.get('is_prebiotic') else 0
+        self.probiotics += step if food.get('is_probiotic') else 0
+
+    def add(self, position, food):
+        logs = self.logs_per_food.get(position, 0)
+        self.logs_per_food[position] = logs + 1
+        if not logs:
+            self.bits |= 1 << position
+            self._count(food, 1)
+
+    def remove(self, position, food):
+        logs = self.logs_per_food.get(position, 0)
+        if not logs:
+            return
+        if logs > 1:
+            self.logs_per_food[position] = logs - 1
+            return
+        del self.logs_per_food[position]
+        self.bits &= ~(1 << position)
+        self._count(food, -1)
+
+    def __bool__(self):
+        return bool(self.bits)
+
+
+_EMPTY_WEEK = WeekRollup()
+
+
+class WeeklyRollups:
+    """Per-week rollups of one user's logs, joined with the catalog by food_id."""
+
+    # El catálogo y su índice son compartidos: no se copian ni cuentan en caches.estimate_size
+    _shared_attributes = ("foods_by_id", "index")
+
+    def __init__(self, foods_by_id, week_start=None):
+        self.foods_by_id = foods_by_id
+        self.index = catalog_index(foods_by_id)
+        self.week_start = WEEK_START if week_start is None else week_start
+        self._weeks = {}  # ordinal del primer día -> WeekRollup
+
+    def week_key(self, day):
+        """Returns the day number of the first day of the week that contains day."""
+        ordinal = _ordinal(day)
+        # El día 1 (0001-01-01) es lunes
+        return ordinal - (ordinal - 1 - self.week_start) % 7
+
+    def _resolve(self, food_id, name):
+        # Devuelve (posición, alimento), o (None, None) si no está en el catálogo
+        if food_id not in self.foods_by_id and name is not None:
+            food_id = self.index.ids_by_name.get(name)
+        position = self.index.positions.get(food_id)
+        if position is None:
+            return None, None
+        return position, self.index.foods[position]
+
+    def add(self, food_id, day, name=None):
+        """Counts one log; logs without a known food or date are ignored, like in compute_weekly_metrics."""
+        position, food = self._resolve(food_id, name)
+        if food is None or day is None:
+            return
+        key = self.week_key(day)
+        week = self._weeks.get(key)
+        if week is None:
+            week = self._weeks[key] = WeekRollup()
+        week.add(position, food)
+
+    def remove(self, food_id, day, name=None):
+        """Uncounts one log previously passed to add."""
+        position, food = self._resolve(food_id, name)
+        if food is None or day is None:
+            return
+        key = self.week_key(day)
+        week = self._weeks.get(key)
+        if week is not None:
+            week.remove(position, food)
+            if not week:
+                del self._weeks[key]
+
+    def week(self, day):
+        """The rollup of the week that contains day (an empty one if nothing was eaten)."""
+        return self._weeks.get(self.week_key(day), _EMPTY_WEEK)
+
+    def weeks(self):
+        """Returns [(first day, WeekRollup)] for every week with logs, oldest first."""
+        return [(date.fromordinal(key), self._weeks[key]) for key in sorted(self._weeks)]
+
+    def foods(self, bits):
+        """The catalog foods in a bitset, in catalog order."""
+        return [self.index.foods[position] for position in bit_ids(bits)]
+
+    def names(self, bits, predicate=None):
+        """Sorted names of the foods in a bitset, optionally only those matching predicate."""
+        return sorted(food['name'] for food in self.foods(bits & self.mask(predicate)))
+
+    def mask(self, predicate=None):
+        """Bitset of the catalog foods matching predicate (all of them if None)."""
+        return self.index.mask(predicate)
+
+    def not_eaten(self, day, predicate=is_plant):
+        """Catalog foods matching predicate that were not eaten in the week of day."""
+        return self.foods(self.mask(predicate) & ~self.week(day).bits)
+
+    def compare(self, day, weeks_back=1):
+        """Compares the week of day with an earlier one; returns bitsets {"new", "repeated", "dropped"}."""
+        current = self.week(day).bits
+        previous = self.week(_ordinal(day) - 7 * weeks_back).bits
+        return {"new": current & ~previous, "repeated": current & previous, "dropped": previous & ~current}
+
+    def weekly_metrics(self, today=None):
+        """The same dict as weekly_metrics.compute_weekly_metrics, plus last week's plant count."""
+        today = today or date.today()
+        week = self.week(today)
+        return {
+            "vegetable_count": week.plants,
+            "vegetables": self.names(week.bits, is_plant),
+            "diversity": {
+                "prebiotic_count": week.prebiotics,
+                "probiotic_count": week.probiotics,
+            },
+            "prebiotics": self.names(week.bits, is_prebiotic),
+            "probiotics": self.names(week.bits, is_probiotic),
+            "last_week_vegetable_count": self.week(today.toordinal() - 7).plants,
+        }
+
+    def __deepcopy__(self, memo):
+        clone = WeeklyRollups.__new__(WeeklyRollups)
+        memo[id(self)] = clone
+        for key, value in vars(self).items():
+            setattr(clone, key, value if key in self._shared_attributes else copy.deepcopy(value, memo))
+        return clone
@@ -0,0 +1,109 @@
+# weekly_metrics.py (Frontend - Métricas semanales calculadas en local)
+#
+# Todas las métricas de la página de inicio (vegetales únicos, prebióticos y
+# probióticos) salen de los mismos registros de la semana. En lugar de pedir cada
+# una a un endpoint distinto, se calculan aquí a partir de /api/user_food_logs y
+# de las categorías del catálogo de alimentos.
+#
+# Se asume que cada alimento del catálogo trae ``category`` y, opcionalmente, los
+# booleanos ``is_prebiotic`` / ``is_probiotic``. Si el catálogo no trae categorías,
+# supports_local_metrics() devuelve False y la app sigue usando los endpoints.
+
+import os
+from datetime import date, datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+# Primer día de la semana (0 = lunes, como en el backend)
+WEEK_START = int(os.environ.get("NUTRIGOAL_WEEK_START", "0"))
+
+# Categorías que cuentan para el reto de las 30 plantas
+PLANT_CATEGORIES = {
+    "vegetable", "fruit", "legume", "grain", "nut", "seed", "herb", "spice",
+    "verdura", "fruta", "legumbre", "cereal", "fruto seco", "semilla", "hierba", "especia",
+}
+
+
+def parse_log_date(value):
+    """Parses a ``date_consumed`` value into a date.
+
+    Accepts ISO dates/datetimes ("2025-10-06", "2025-10-06T08:30:00") and the
+    RFC 1123 format Flask uses to serialize dates ("Mon, 06 Oct 2025 00:00:00 GMT").
+    Returns None if the value cannot be parsed.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).date()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def week_bounds(day, week_start=None):
+    """Returns the (first, last) dates of the week that contains day."""
+    week_start = WEEK_START if week_start is None else week_start
+    first = day - timedelta(days=(day.weekday() - week_start) % 7)
+    return first, first + timedelta(days=6)
+
+
+def supports_local_metrics(foods):
+    """True if the catalog carries the category data the engine needs."""
+    return bool(foods) and all('category' in food for food in foods)
+
+
+def is_plant(food):
+    return str(food.get('category', '')).lower() in PLANT_CATEGORIES
+
+
+def _resolve_food(log, foods_by_id, foods_by_name):
+    food = foods_by_id.get(log.get('food_id'))
+    if food is None:
+        food = foods_by_name.get(log.get('food_name'))
+    return food
+
+
+def compute_weekly_metrics(logs, foods, today=None, week_start=None):
+    """Computes every weekly counter and list the home page shows.
+
+    ``logs`` is the list returned by /api/user_food_logs and ``foods`` the
+    catalog in the user's language. Logs are joined with the catalog by
+    ``food_id`` (or by name if the log has no id), restricted to the current
+    week, and counted once per distinct food.
+    """
+    today = today or date.today()
+    first, last = week_bounds(today, week_start)
+    foods_by_id = {food['id']: food for food in foods}
+    foods_by_name = {food['name']: food for food in foods}
+
+    vegetables, prebiotics, probiotics = {}, {}, {}
+    for log in logs:
+        day = parse_log_date(log.get('date_consumed'))
+        if day is None or not first <= day <= last:
+            continue
+        food = _resolve_food(log, foods_by_id, foods_by_name)
+        if food is None:
+            continue
+        if is_plant(food):
+            vegetables[food['id']] = food['name']
+        if food.get('is_prebiotic'):
+            prebiotics[food['id']] = food['name']
+        if food.get('is_probiotic'):
+            probiotics[food['id']] = food['name']
+
+    return {
+        "vegetable_count": len(vegetables),
+        "vegetables": sorted(vegetables.values()),
+        "diversity": {
+            "prebiotic_count": len(prebiotics),
+            "probiotic_count": len(probiotics),
+        },
+        "prebiotics": sorted(prebiotics.values()),
+        "probiotics": sorted(probiotics.values()),
+    }
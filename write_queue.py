@@ -0,0 +1,403 @@
+# write_queue.py (Frontend - Cola local de escrituras pendientes)
+#
+# Si la API no responde al añadir o borrar un registro, la operación no se
+# pierde: se guarda en una base SQLite dentro de NUTRIGOAL_DATA_DIR y un hilo en
+# segundo plano la reenvía cuando la API vuelve. Mientras tanto la página la
+# muestra como pendiente (ver dashboard.apply_queued_ops).
+#
+# Cada operación lleva una clave de idempotencia generada en el cliente (la
+# misma que ya se usó en el primer intento) que viaja en la cabecera
+# Idempotency-Key. Una fila solo se borra cuando el servidor ha confirmado la
+# operación, así que tras una caída se reintenta con la misma clave y el
+# servidor la reconoce en lugar de crear un registro duplicado.
+#
+# Varios procesos pueden compartir la base: cada uno "alquila" las filas que va
+# a enviar durante NUTRIGOAL_FLUSH_LEASE segundos para no mandarlas dos veces a
+# la vez; si el proceso muere, el alquiler caduca y otro las recoge.
+#
+# El token del usuario no se guarda en la base: cada sesión con la sesión
+# iniciada registra el suyo en memoria (bind_token) y el hilo envía las
+# operaciones de un usuario con el token más reciente que conozca este proceso.
+# Las de usuarios sin token conocido esperan a que vuelvan a entrar. El token se
+# olvida al cerrar sesión y también cuando Streamlit descarta la última sesión
+# que lo usaba (su CacheLease, ver caches.on_owner_released); un token nuevo
+# despierta al hilo para que envíe enseguida lo que estaba esperando. La base solo
+# la puede leer el usuario del proceso (permisos 0600, en una carpeta 0700).
+#
+# De cada alta que envía, el hilo recuerda durante NUTRIGOAL_SENT_ADDS_TTL
+# segundos el log_id que ha devuelto el servidor (sent_adds): la página sigue
+# mostrando el registro pendiente hasta que la reconciliación trae ese log_id.
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+
+import requests
+
+from api_client import IDEMPOTENCY_HEADER, api_delete, api_post, breaker_state
+from caches import BoundedCache, on_owner_released
+from storage import data_path
+from tracing import trace
+
+# Segundos entre dos rondas de envío y operaciones enviadas por ronda
+FLUSH_INTERVAL = float(os.environ.get("NUTRIGOAL_FLUSH_INTERVAL", "10"))
+FLUSH_BATCH = int(os.environ.get("NUTRIGOAL_FLUSH_BATCH", "20"))
+FLUSH_LEASE = float(os.environ.get("NUTRIGOAL_FLUSH_LEASE", "60"))
+# Segundos que se recuerda el log_id de un alta ya enviada (ver sent_adds)
+SENT_ADDS_TTL = float(os.environ.get("NUTRIGOAL_SENT_ADDS_TTL", "600"))
+
+QUEUE_FILE = "write_queue.sqlite3"
+
+# Respuestas que rechazan la operación en sí (datos no válidos, alimento que no
+# existe): se descarta. Cualquier otro fallo la deja en la cola
+REJECTED_STATUSES = {400, 404, 422}
+# Token caducado o revocado: las operaciones del usuario esperan a que una de sus
+# sesiones traiga uno nuevo (bind_token)
+AUTH_STATUSES = {401, 403}
+
+logger = logging.getLogger(__name__)
+
+_conn = None
+_conn_lock = threading.RLock()
+_tokens = {}  # username -> token de su sesión más reciente en este proceso
+_tokens_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+_wake = threading.Event()
+# (username, op_key) -> la operación enviada, con el log_id del servidor; el token es el dueño
+_sent_adds = BoundedCache("sent_adds", max_entries=10000, ttl=SENT_ADDS_TTL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ops (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op_key TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    food_id INTEGER,
+    food_name TEXT,
+    log_id INTEGER,
+    day TEXT,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ops_by_user ON ops (username, id);
+"""
+
+_OP_COLUMNS = "op_key, username, kind, food_id, food_name, log_id, day"
+_ALL_COLUMNS = ("id, op_key, username, kind, food_id, food_name, log_id, day, created_at, attempts, lease_until,"
+                " last_error")
+
+
+def _restrict_permissions(path):
+    # Solo el usuario del proceso puede leer la cola; SQLite da los mismos
+    # permisos a los ficheros -wal y -shm que crea
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    for name in (path, path + "-wal", path + "-shm"):
+        try:
+            os.chmod(name, 0o600)
+        except FileNotFoundError:
+            pass
+
+
+def _drop_token_column(conn):
+    # Las bases de versiones anteriores guardaban el token de cada operación
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(ops)")}
+        migrate = "token" in columns
+        if migrate:
+            conn.execute("DROP INDEX IF EXISTS ops_by_user")
+            conn.execute("ALTER TABLE ops RENAME TO ops_with_tokens")
+            for statement in _SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"INSERT INTO ops ({_ALL_COLUMNS}) SELECT {_ALL_COLUMNS} FROM ops_with_tokens")
+            conn.execute("DROP TABLE ops_with_tokens")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    if migrate:
+        # Sin esto los tokens seguirían en las páginas libres del fichero (y en el -wal)
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+@contextlib.contextmanager
+def _connection():
+    """Yields the process's connection, opened on first use; the lock serializes its use between threads.
+
+    Script runs get a new thread every time, so a connection per thread would
+    repeat the connect, pragmas and schema on every rerun.
+    """
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            path = data_path(QUEUE_FILE)
+            _restrict_permissions(path)
+            conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            _drop_token_column(conn)
+            _conn = conn
+        yield _conn
+
+
+def bind_token(username, token):
+    """Sends the user's queued operations with this token (their session's current one) from now on.
+
+    A token that was not bound yet wakes the flusher, so operations waiting
+    for it go out now instead of at the next interval.
+    """
+    if not (username and token):
+        return
+    with _tokens_lock:
+        changed = _tokens.get(username) != token
+        _tokens[username] = token
+    if changed:
+        wake_flusher()
+
+
+def forget_token(username, token=None):
+    """Stops sending the user's operations until bind_token is called again.
+
+    With ``token``, only if it is still the bound one (a session may have
+    brought a fresh one meanwhile).
+    """
+    with _tokens_lock:
+        if token is None or _tokens.get(username) == token:
+            _tokens.pop(username, None)
+
+
+def _forget_released_token(token):
+    # Ninguna sesión de este proceso usa ya este token
+    with _tokens_lock:
+        for username in [username for username, bound in _tokens.items() if bound == token]:
+            del _tokens[username]
+
+
+on_owner_released(_forget_released_token)
+
+
+def new_op_key():
+    """Returns a fresh idempotency key for one add or delete."""
+    return uuid.uuid4().hex
+
+
+def enqueue_add(username, token, food_id, food_name, op_key, day=None):
+    """Stores a food log that could not be sent; returns the queued op.
+
+    The token is not stored, only bound in memory (see bind_token).
+    """
+    day = (day or date.today()).isoformat()
+    bind_token(username, token)
+    with _connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO ops (op_key, username, kind, food_id, food_name, day, created_at)"
+            " VALUES (?, ?, 'add', ?, ?, ?, ?)",
+            (op_key, username, food_id, food_name, day, time.time()),
+        )
+    start_flusher()
+    return {"op_key": op_key, "username": username, "kind": "add", "food_id": food_id,
+            "food_name": food_name, "log_id": None, "day": day}
+
+
+def enqueue_delete(username, token, log_id, op_key=None):
+    """Stores a log deletion that could not be sent; returns the queued op."""
+    op_key = op_key or new_op_key()
+    bind_token(username, token)
+    with _connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO ops (op_key, username, kind, log_id, created_at)"
+            " VALUES (?, ?, 'delete', ?, ?)",
+            (op_key, username, log_id, time.time()),
+        )
+    start_flusher()
+    return {"op_key": op_key, "username": username, "kind": "delete", "food_id": None,
+            "food_name": None, "log_id": log_id, "day": None}
+
+
+def pending_ops(username):
+    """Returns the user's queued operations, oldest first."""
+    try:
+        with _connection() as conn:
+            rows = conn.execute(
+                f"SELECT {_OP_COLUMNS} FROM ops WHERE username = ? ORDER BY id", (username,)
+            ).fetchall()
+    except sqlite3.Error:
+        logger.warning("Could not read the write queue", exc_info=True)
+        return []
+    return [dict(row) for row in rows]
+
+
+def sent_adds(username):
+    """Returns the user's adds this process sent recently, by op_key, with the server's ``log_id``.
+
+    ``sent_at`` is the time.monotonic() of the confirmation.
+    """
+    sent = {}
+    for key in _sent_adds.keys():
+        op = _sent_adds.get(key) if key[0] == username else None
+        if op is not None:
+            sent[key[1]] = op
+    return sent
+
+
+def forget_sent_log(username, log_id):
+    """Forgets a sent add once its log is deleted, so it is not shown as pending again."""
+    for key in _sent_adds.keys():
+        op = _sent_adds.get(key) if key[0] == username else None
+        if op is not None and op["log_id"] == log_id:
+            _sent_adds.pop(key)
+
+
+def _claim(limit, usernames):
+    """Leases up to limit operations of these users that no other flusher is sending."""
+    now = time.time()
+    placeholders = ", ".join("?" * len(usernames))
+    with _connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, username, kind, food_id, food_name, log_id, day, op_key FROM ops"
+                f" WHERE lease_until < ? AND username IN ({placeholders}) ORDER BY id LIMIT ?",
+                (now, *usernames, limit),
+            ).fetchall()
+            conn.executemany("UPDATE ops SET lease_until = ? WHERE id = ?",
+                             [(now + FLUSH_LEASE, row["id"]) for row in rows])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return rows
+
+
+def _send(op, token):
+    headers = {IDEMPOTENCY_HEADER: op["op_key"]}
+    if op["kind"] == "add":
+        response = api_post("/api/user_food_logs", token, headers=headers,
+                            json={"food_id": op["food_id"], "date_consumed": op["day"]})
+        done = response.status_code in (200, 201)
+        if done:
+            _remember_sent(op, token, response)
+        return response.status_code, done
+    response = api_delete(f"/api/user_food_logs/{op['log_id']}", token, headers=headers)
+    # Un 404 al borrar significa que ya no existe: el objetivo se ha cumplido
+    return response.status_code, response.status_code in (200, 204, 404)
+
+
+def _remember_sent(op, token, response):
+    try:
+        body = response.json()
+    except ValueError:
+        return
+    log_id = body.get('log_id', body.get('id')) if isinstance(body, dict) else None
+    if log_id is not None:
+        _sent_adds.set((op["username"], op["op_key"]),
+                       {"op_key": op["op_key"], "username": op["username"], "kind": "add",
+                        "food_id": op["food_id"], "food_name": op["food_name"], "log_id": log_id,
+                        "day": op["day"], "sent_at": time.monotonic()},
+                       owner=token)
+
+
+def flush_once(limit=FLUSH_BATCH):
+    """Sends up to limit queued operations; returns how many were confirmed.
+
+    Stops at the first connection error, 5xx or other unexpected answer,
+    leaving the rest for the next round. Operations the server rejects as
+    invalid (``REJECTED_STATUSES``) are dropped and logged. Only users with a
+    bound token (see bind_token) are sent; a 401/403 unbinds it and keeps that
+    user's operations until a session brings a fresh one. A round that sends
+    something is traced like a rerun (see tracing.py).
+    """
+    if breaker_state()["state"] == "open":
+        return 0
+    with _tokens_lock:
+        tokens = dict(_tokens)
+    if not tokens:
+        return 0
+    rows = _claim(limit, list(tokens))
+    if not rows:
+        return 0
+    with trace("write_queue_flush", ops=len(rows)):
+        return _flush_rows(rows, tokens)
+
+
+def _release(op, error):
+    with _connection() as conn:
+        conn.execute("UPDATE ops SET attempts = attempts + 1, last_error = ?, lease_until = 0 WHERE id = ?",
+                     (error, op["id"]))
+
+
+def _flush_rows(rows, tokens):
+    sent = 0
+    unauthorized = set()
+    for i, op in enumerate(rows):
+        if op["username"] in unauthorized:
+            with _connection() as conn:
+                conn.execute("UPDATE ops SET lease_until = 0 WHERE id = ?", (op["id"],))
+            continue
+        try:
+            status, done = _send(op, tokens[op["username"]])
+        except requests.exceptions.RequestException as e:
+            status, done, error = None, False, str(e)
+        else:
+            error = None if done else f"HTTP {status}"
+
+        if done or status in REJECTED_STATUSES:
+            if not done:
+                logger.warning("Dropping queued %s %s rejected with %s", op["kind"], op["op_key"], status)
+            with _connection() as conn:
+                conn.execute("DELETE FROM ops WHERE id = ?", (op["id"],))
+            sent += done
+            continue
+
+        if status in AUTH_STATUSES:
+            # Las demás operaciones del usuario tampoco pasarían con este token
+            forget_token(op["username"], tokens[op["username"]])
+            unauthorized.add(op["username"])
+            _release(op, error)
+            continue
+
+        # Fallo pasajero: liberar esta fila y las que quedaban para la próxima ronda
+        _release(op, error)
+        with _connection() as conn:
+            conn.executemany("UPDATE ops SET lease_until = 0 WHERE id = ?",
+                             [(row["id"],) for row in rows[i + 1:]])
+        break
+    return sent
+
+
+def _flush_forever():
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            while flush_once() == FLUSH_BATCH:
+                pass
+        except Exception:
+            logger.exception("Write queue flush failed")
+
+
+def start_flusher():
+    """Starts this process's background flusher thread if it is not running yet."""
+    global _flusher
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_forever, name="write-queue-flusher", daemon=True)
+                _flusher.start()
+
+
+def wake_flusher():
+    """Asks the flusher to start a round now instead of waiting for the interval."""
+    _wake.set()